@@ -24,12 +24,20 @@ static const char TOPIC_INITIAL_STAT[] = "stat1";
 static const char TOPIC_OTA_RESPONSE[] = "otares";
 static const char TOPIC_RELAY_POWER[] = "power";
 static const char TOPIC_ADMIN_OTA[] = "admin/ota";
+static const char TOPIC_ADMIN_OTA_ANY[] = "admin/ota/+";
+static const char TOPIC_ADMIN_OTA_BEGIN[] = "admin/ota/begin";
+static const char TOPIC_ADMIN_OTA_CHUNK[] = "admin/ota/chunk";
+static const char TOPIC_ADMIN_OTA_END[] = "admin/ota/end";
+static const char TOPIC_OTA_ACK[] = "otaack";
 static const uint16_t MQTT_KEEPALIVE = 30;
 
 enum class IncomingMessage {
     UNKNOWN,
     RELAY_POWER,
-    OTA
+    OTA,
+    OTA_BEGIN,
+    OTA_CHUNK,
+    OTA_END
 };
 
 using namespace espMqttClientTypes;
@@ -49,6 +57,7 @@ MQTT::MQTT() {
 
         subscribe(TOPIC_RELAY_POWER, 1);
         subscribe(TOPIC_ADMIN_OTA);
+        subscribe(TOPIC_ADMIN_OTA_ANY, 1);
     });
 
     client.onDisconnect([&](DisconnectReason reason) {
@@ -58,7 +67,8 @@ MQTT::MQTT() {
             PRINTLN("reason: bad fingerprint");
 #endif
 
-        if (ota.started()) {
+        // chunked updates are kept, so that they can be resumed after reconnecting
+        if (ota.started() && !ota.chunked) {
             PRINTLN("mqtt: update was in progress, canceling..");
             ota.clean();
             Update.end();
@@ -98,6 +108,12 @@ MQTT::MQTT() {
             msgType = IncomingMessage::RELAY_POWER;
         else if (relevantTopic == TOPIC_ADMIN_OTA)
             msgType = IncomingMessage::OTA;
+        else if (relevantTopic == TOPIC_ADMIN_OTA_BEGIN)
+            msgType = IncomingMessage::OTA_BEGIN;
+        else if (relevantTopic == TOPIC_ADMIN_OTA_CHUNK)
+            msgType = IncomingMessage::OTA_CHUNK;
+        else if (relevantTopic == TOPIC_ADMIN_OTA_END)
+            msgType = IncomingMessage::OTA_END;
 
         if (len != total && msgType != IncomingMessage::OTA) {
             PRINTLN("mqtt: received partial message, not supported");
@@ -115,6 +131,24 @@ MQTT::MQTT() {
             handleAdminOtaPayload(properties.packetId, payload, len, index, total);
             break;
 
+        case IncomingMessage::OTA_BEGIN:
+            if (ota.finished)
+                break;
+            handleAdminOtaBeginPayload(payload, total);
+            break;
+
+        case IncomingMessage::OTA_CHUNK:
+            if (ota.finished)
+                break;
+            handleAdminOtaChunkPayload(payload, total);
+            break;
+
+        case IncomingMessage::OTA_END:
+            if (ota.finished)
+                break;
+            handleAdminOtaEndPayload(payload, total);
+            break;
+
         case IncomingMessage::UNKNOWN:
             PRINTF("error: invalid topic %s\n", topic);
             break;
@@ -214,6 +248,14 @@ uint16_t MQTT::sendOtaResponse(OTAResult status, uint8_t error_code) {
     return publish(TOPIC_OTA_RESPONSE, reinterpret_cast<uint8_t*>(&resp), sizeof(resp));
 }
 
+uint16_t MQTT::sendOtaAck(OTAResult status, uint32_t offset) {
+    OTAAck ack{
+            .status = status,
+            .offset = offset
+    };
+    return publish(TOPIC_OTA_ACK, reinterpret_cast<uint8_t*>(&ack), sizeof(ack));
+}
+
 void MQTT::handleRelayPowerPayload(const uint8_t *payload, uint32_t length) {
     if (length != sizeof(PowerPayload)) {
         PRINTF("error: size of payload (%ul) does not match expected (%ul)\n",
@@ -350,4 +392,147 @@ void MQTT::handleAdminOtaPayload(uint16_t packetId, const uint8_t *payload, size
     }
 }
 
-}
\ No newline at end of file
+void MQTT::handleAdminOtaBeginPayload(const uint8_t *payload, size_t length) {
+    if (length != sizeof(OTABeginPayload)) {
+        PRINTF("mqtt/ota: error: size of payload (%ul) does not match expected (%ul)\n",
+               length, sizeof(OTABeginPayload));
+        return;
+    }
+
+    auto pd = reinterpret_cast<const struct OTABeginPayload*>(payload);
+    if (memcmp(pd->secret, HOME_SECRET, HOME_SECRET_SIZE) != 0) {
+        PRINTLN("mqtt/ota: invalid secret");
+        return;
+    }
+
+    // same image as the one being written, not just of the same size
+    if (ota.chunked && Update.isRunning() && Update.size() == pd->size && memcmp(ota.md5, pd->md5, sizeof(ota.md5)) == 0) {
+        PRINTF("mqtt/ota: resuming update at %u/%u\n", ota.written, Update.size());
+    } else {
+        if (Update.isRunning()) {
+            Update.end();
+            Update.clearError();
+        }
+        ota.clean();
+
+        Update.runAsync(true);
+        if (!Update.begin(pd->size)) {
+            uint8_t error = Update.getError();
+#ifdef DEBUG
+            Update.printError(Serial);
+#endif
+            Update.clearError();
+            sendOtaAck(OTAResult::UPDATE_ERROR, 0);
+            sendOtaResponse(OTAResult::UPDATE_ERROR, error);
+            return;
+        }
+
+        ota.chunked = true;
+        memcpy(ota.md5, pd->md5, sizeof(ota.md5));
+        PRINTF("mqtt/ota: starting chunked update, total=%ul\n", pd->size);
+    }
+
+    sendOtaAck(OTAResult::OK, ota.written);
+}
+
+void MQTT::handleAdminOtaChunkPayload(const uint8_t *payload, size_t length) {
+    if (length < sizeof(OTAChunkHeader)) {
+        PRINTLN("mqtt/ota: chunk is too small");
+        return;
+    }
+
+    auto hdr = reinterpret_cast<const struct OTAChunkHeader*>(payload);
+    if (memcmp(hdr->secret, HOME_SECRET, HOME_SECRET_SIZE) != 0) {
+        PRINTLN("mqtt/ota: invalid secret");
+        return;
+    }
+
+    if (!ota.chunked || !Update.isRunning()) {
+        PRINTLN("mqtt/ota: update is not running");
+        sendOtaAck(OTAResult::UPDATE_ERROR, 0);
+        return;
+    }
+
+    // chunks at unexpected offsets (retransmissions) are not written, the ack
+    // tells the sender where to continue from
+    if (hdr->offset == ota.written) {
+        size_t dataLength = length - sizeof(OTAChunkHeader);
+        size_t written;
+        if ((written = Update.write(const_cast<uint8_t*>(payload) + sizeof(OTAChunkHeader), dataLength)) != dataLength) {
+            PRINTF("mqtt/ota: error: tried to write %ul bytes, write() returned %ul\n",
+                   dataLength, written);
+            ota.clean();
+            Update.end();
+            Update.clearError();
+            sendOtaAck(OTAResult::WRITE_ERROR, 0);
+            return;
+        }
+        ota.written += dataLength;
+
+        esp_led.blink(1, 1);
+        PRINTF("mqtt/ota: updating %u/%u\n", ota.written, Update.size());
+    } else {
+        PRINTF("mqtt/ota: unexpected offset, expected %ul, got %ul\n", ota.written, hdr->offset);
+    }
+
+    sendOtaAck(OTAResult::OK, ota.written);
+}
+
+void MQTT::handleAdminOtaEndPayload(const uint8_t *payload, size_t length) {
+    char md5[33];
+    char* md5Ptr = md5;
+
+    if (length != sizeof(OTAEndPayload)) {
+        PRINTF("mqtt/ota: error: size of payload (%ul) does not match expected (%ul)\n",
+               length, sizeof(OTAEndPayload));
+        return;
+    }
+
+    auto pd = reinterpret_cast<const struct OTAEndPayload*>(payload);
+    if (memcmp(pd->secret, HOME_SECRET, HOME_SECRET_SIZE) != 0) {
+        PRINTLN("mqtt/ota: invalid secret");
+        return;
+    }
+
+    if (!ota.chunked || !Update.isRunning()) {
+        PRINTLN("mqtt/ota: update is not running");
+        sendOtaResponse(OTAResult::UPDATE_ERROR);
+        return;
+    }
+
+    if (!Update.isFinished()) {
+        PRINTF("mqtt/ota: update is not complete yet, written %u/%u\n", ota.written, Update.size());
+        sendOtaResponse(OTAResult::UPDATE_ERROR);
+        return;
+    }
+
+    for (int i = 0; i < MD5_SIZE; i++)
+        md5Ptr += sprintf(md5Ptr, "%02x", pd->md5[i]);
+    md5[32] = '\0';
+    PRINTF("mqtt/ota: md5 is %s\n", md5);
+
+    if (!Update.setMD5(md5)) {
+        PRINTLN("mqtt/ota: setMD5 failed");
+        sendOtaResponse(OTAResult::UPDATE_ERROR);
+        return;
+    }
+
+    if (Update.end()) {
+        ota.finished = true;
+        ota.publishResultPacketId = sendOtaResponse(OTAResult::OK);
+        PRINTF("mqtt/ota: ok, otares packet_id=%d\n", ota.publishResultPacketId);
+    } else {
+        uint8_t error = Update.getError();
+        ota.clean();
+
+        PRINTF("mqtt/ota: error: %u\n", error);
+#ifdef DEBUG
+        Update.printError(Serial);
+#endif
+        Update.clearError();
+
+        sendOtaResponse(OTAResult::UPDATE_ERROR, error);
+    }
+}
+
+}
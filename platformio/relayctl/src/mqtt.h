@@ -16,26 +16,33 @@ struct OTAStatus {
     uint16_t publishResultPacketId;
     bool finished;
     bool readyToRestart;
+    bool chunked;
     size_t written;
+    uint8_t md5[16];  // of the image being written by the chunked update
 
     OTAStatus()
         : dataPacketId(0)
         , publishResultPacketId(0)
         , finished(false)
         , readyToRestart(false)
+        , chunked(false)
         , written(0)
-    {}
+    {
+        memset(md5, 0, sizeof(md5));
+    }
 
     inline void clean() {
         dataPacketId = 0;
         publishResultPacketId = 0;
         finished = false;
         readyToRestart = false;
+        chunked = false;
         written = 0;
+        memset(md5, 0, sizeof(md5));
     }
 
     inline bool started() const {
-        return dataPacketId != 0;
+        return dataPacketId != 0 || chunked;
     }
 };
 
@@ -49,11 +56,15 @@ private:
 
     void handleRelayPowerPayload(const uint8_t* payload, uint32_t length);
     void handleAdminOtaPayload(uint16_t packetId, const uint8_t* payload, size_t length, size_t index, size_t total);
+    void handleAdminOtaBeginPayload(const uint8_t* payload, size_t length);
+    void handleAdminOtaChunkPayload(const uint8_t* payload, size_t length);
+    void handleAdminOtaEndPayload(const uint8_t* payload, size_t length);
 
     uint16_t publish(const String& topic, uint8_t* payload, size_t length);
     uint16_t subscribe(const String& topic, uint8_t qos = 0);
     void sendInitialStat();
     uint16_t sendOtaResponse(OTAResult status, uint8_t error_code = 0);
+    uint16_t sendOtaAck(OTAResult status, uint32_t offset);
 
 public:
     StopWatch statStopWatch;
@@ -98,4 +109,25 @@ struct OTAResponse {
     uint8_t error_code;
 } __attribute__((packed));
 
+struct OTABeginPayload {
+    char secret[12];
+    uint32_t size;
+    uint8_t md5[16];
+} __attribute__((packed));
+
+struct OTAChunkHeader {
+    char secret[12];
+    uint32_t offset;
+} __attribute__((packed));
+
+struct OTAEndPayload {
+    char secret[12];
+    uint8_t md5[16];
+} __attribute__((packed));
+
+struct OTAAck {
+    OTAResult status;
+    uint32_t offset;
+} __attribute__((packed));
+
 } }
\ No newline at end of file
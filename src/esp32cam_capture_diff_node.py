@@ -63,9 +63,8 @@ class ESP32CamCaptureDiffNode:
 
                 # send to telegram
                 if 'telegram' in config:
-                    await telegram.send_message(f'pyssim: score={score}')
-                    await telegram.send_photo(filename)
-                    await telegram.send_photo(second_filename)
+                    await telegram.send_photos([filename, second_filename],
+                                               caption=f'pyssim: score={score}')
 
         self.first = False
 
@@ -84,3 +83,6 @@ if __name__ == '__main__':
         loop.run_forever()
     except KeyboardInterrupt:
         pass
+    finally:
+        # sends what's queued and closes the session
+        loop.run_until_complete(telegram.close())
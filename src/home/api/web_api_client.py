@@ -73,12 +73,19 @@ class WebAPIClient:
 
     def get_sensors_data(self,
                          sensor: TemperatureSensorLocation,
-                         hours: int):
-        data = self._get('sensors/data/', {
+                         hours: int,
+                         resolution: Optional[int] = None,
+                         ranges=False):
+        params = {
             'sensor': sensor.value,
             'hours': hours
-        })
-        return [(datetime.fromtimestamp(date), temp, hum) for date, temp, hum in data]
+        }
+        if resolution is not None:
+            params['resolution'] = resolution
+        if ranges:
+            params['ranges'] = 1
+        data = self._get('sensors/data/', params)
+        return [(datetime.fromtimestamp(row[0]), *row[1:]) for row in data]
 
     def add_sound_sensor_hits(self,
                               hits: List[Tuple[str, int]]):
@@ -112,10 +119,19 @@ class WebAPIClient:
             'to': s_to
         })
 
-    def inverter_get_grid_consumed_energy(self, s_from: str, s_to: str):
+    def inverter_get_grid_consumed_energy(self, s_from: str, s_to: str, breakdown=False):
         return self._get('inverter/grid_consumed_energy/', {
             'from': s_from,
-            'to': s_to
+            'to': s_to,
+            'breakdown': int(breakdown)
+        })
+
+    def inverter_get_status_series(self, s_from: str, s_to: str, fields: List[str], step=60):
+        return self._get('inverter/status_series/', {
+            'from': s_from,
+            'to': s_to,
+            'fields': ','.join(fields),
+            'step': step
         })
 
     @staticmethod
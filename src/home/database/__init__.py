@@ -6,6 +6,7 @@ __all__ = [
     'get_clickhouse',
     'SimpleState',
 
+    'ClickhouseDatabase',
     'SensorsDatabase',
     'InverterDatabase',
     'BotsDatabase'
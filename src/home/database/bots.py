@@ -1,3 +1,4 @@
+import re
 import pytz
 
 from .mysql import mysql_now, MySQLDatabase, datetime_fmt
@@ -5,9 +6,42 @@ from ..api.types import (
     BotType,
     SoundSensorLocation
 )
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict
 from datetime import datetime
 from html import escape
+from ..util import chunks
+
+# Rows per multi-row INSERT statement.
+InsertChunkSize = 1000
+
+_mac_re = re.compile(r'(?<![0-9a-f:])([0-9a-f]{2}(?::[0-9a-f]{2}){5})(?![0-9a-f:])', re.I)
+
+# (substring, event) pairs, first match wins; keep in sync with the backfill
+# query in doc/database.md
+_openwrt_events = (
+    ('AP-STA-CONNECTED', 'connected'),
+    ('AP-STA-DISCONNECTED', 'disconnected'),
+    ('disassociated', 'disassociated'),
+    ('associated', 'associated'),
+    ('deauthenticated', 'deauthenticated'),
+    ('authenticated', 'authenticated'),
+    ('pairwise key handshake completed', 'handshake'),
+    ('DHCPACK', 'dhcp_ack'),
+)
+
+
+def parse_openwrt_log_line(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (mac, event) found in the line, both may be None."""
+    match = _mac_re.search(text)
+    mac = match.group(1).lower() if match else None
+
+    event = None
+    for substr, name in _openwrt_events:
+        if substr in text:
+            event = name
+            break
+
+    return mac, event
 
 
 class OpenwrtLogRecord:
@@ -16,11 +50,16 @@ class OpenwrtLogRecord:
     received_time: datetime
     text: str
 
-    def __init__(self, id, text, log_time, received_time):
+    mac: Optional[str]
+    event: Optional[str]
+
+    def __init__(self, id, text, log_time, received_time, mac=None, event=None):
         self.id = id
         self.text = text
         self.log_time = log_time
         self.received_time = received_time
+        self.mac = mac
+        self.event = event
 
     def __repr__(self):
         return f"<b>{self.log_time.strftime('%H:%M:%S')}</b> {escape(self.text)}"
@@ -31,28 +70,32 @@ class BotsDatabase(MySQLDatabase):
                     bot: BotType,
                     user_id: int,
                     message: str):
-        with self.cursor() as cursor:
+        with self.prepared_cursor('add_request') as cursor:
             cursor.execute("INSERT INTO requests_log (user_id, message, bot, time) VALUES (%s, %s, %s, %s)",
                            (user_id, message, bot.name.lower(), mysql_now()))
-        self.commit()
+            self.commit()
 
     def add_openwrt_logs(self,
-                         lines: List[Tuple[datetime, str]]):
-        now = datetime.now()
+                         lines: List[Tuple[datetime, str]],
+                         chunk_size: int = InsertChunkSize):
+        now = datetime.now().strftime(datetime_fmt)
+        rows = [(time.strftime(datetime_fmt), now, text, *parse_openwrt_log_line(text)) for time, text in lines]
         with self.cursor() as cursor:
-            for line in lines:
-                time, text = line
-                cursor.execute("INSERT INTO openwrt (log_time, received_time, text) VALUES (%s, %s, %s)",
-                               (time.strftime(datetime_fmt), now.strftime(datetime_fmt), text))
-        self.commit()
+            # executemany() sends an INSERT with multiple VALUES per chunk
+            for chunk in chunks(rows, chunk_size):
+                cursor.executemany("INSERT INTO openwrt (log_time, received_time, text, mac, event)"
+                                   " VALUES (%s, %s, %s, %s, %s)", chunk)
+            self.commit()
 
     def add_sound_hits(self,
                        hits: List[Tuple[SoundSensorLocation, int]],
-                       time: datetime):
+                       time: datetime,
+                       chunk_size: int = InsertChunkSize):
+        time_s = time.strftime(datetime_fmt)
+        rows = [(loc.name.lower(), time_s, count) for loc, count in hits]
         with self.cursor() as cursor:
-            for loc, count in hits:
-                cursor.execute("INSERT INTO sound_hits (location, `time`, hits) VALUES (%s, %s, %s)",
-                               (loc.name.lower(), time.strftime(datetime_fmt), count))
+            for chunk in chunks(rows, chunk_size):
+                cursor.executemany("INSERT INTO sound_hits (location, `time`, hits) VALUES (%s, %s, %s)", chunk)
             self.commit()
 
     def get_sound_hits(self,
@@ -94,11 +137,49 @@ class BotsDatabase(MySQLDatabase):
             cursor.execute(sql, (f'%{filter_text}%', min_id))
             data = []
             for row in cursor.fetchall():
-                data.append(OpenwrtLogRecord(
-                    id=int(row['id']),
-                    text=row['text'],
-                    log_time=row['log_time'].astimezone(tz),
-                    received_time=row['received_time'].astimezone(tz)
-                ))
+                data.append(self._openwrt_log_record(row, tz))
+
+            return data
 
+    def get_openwrt_logs_by_mac(self,
+                                macs: List[str],
+                                min_id: int,
+                                limit: Optional[int] = None) -> Dict[str, List[OpenwrtLogRecord]]:
+        """
+        Returns new records of all devices at once, using the (mac, id) index.
+        limit is applied per device: each device gets its own subquery, which
+        stops reading the index after limit rows.
+        """
+        macs = [mac.lower() for mac in macs]
+        data = {mac: [] for mac in macs}
+        if not macs:
             return data
+
+        tz = pytz.timezone('Europe/Moscow')
+        with self.cursor(dictionary=True) as cursor:
+            if limit is None:
+                placeholders = ', '.join(['%s'] * len(macs))
+                cursor.execute(f"SELECT * FROM openwrt WHERE mac IN ({placeholders}) AND id > %s ORDER BY id",
+                               (*macs, min_id))
+            else:
+                subquery = f"(SELECT * FROM openwrt WHERE mac = %s AND id > %s ORDER BY id LIMIT {int(limit)})"
+                args = []
+                for mac in macs:
+                    args.extend((mac, min_id))
+                cursor.execute(' UNION ALL '.join([subquery] * len(macs)) + ' ORDER BY id', tuple(args))
+
+            for row in cursor.fetchall():
+                data[row['mac']].append(self._openwrt_log_record(row, tz))
+
+        return data
+
+    @staticmethod
+    def _openwrt_log_record(row: dict, tz) -> OpenwrtLogRecord:
+        return OpenwrtLogRecord(
+            id=int(row['id']),
+            text=row['text'],
+            log_time=row['log_time'].astimezone(tz),
+            received_time=row['received_time'].astimezone(tz),
+            mac=row.get('mac'),
+            event=row.get('event')
+        )
@@ -1,25 +1,135 @@
+import asyncio
 import logging
+import threading
 
+from queue import LifoQueue, Empty
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta
+from typing import Optional
 from clickhouse_driver import Client as ClickhouseClient
-from ..config import is_development_mode
+from ..config import config, is_development_mode
 
-_links = {}
+_pools = {}
+_pools_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
 
 
-def get_clickhouse(db: str) -> ClickhouseClient:
-    if db not in _links:
-        _links[db] = ClickhouseClient.from_url(f'clickhouse://localhost/{db}')
+def clickhouse_option(name: str, default):
+    # options of the [clickhouse] config section are all optional
+    if 'clickhouse' in config and name in config['clickhouse']:
+        return config['clickhouse'][name]
+    return default
 
-    return _links[db]
+
+class ClickhousePool:
+    """
+    Bounded pool of clickhouse_driver clients, which are not thread-safe.
+    A client is checked out for the duration of a call; nested checkouts from
+    the same thread get the same client.
+    """
+
+    def __init__(self, db: str, size: int, timeout: float):
+        self.db = db
+        self.size = size
+        self.timeout = timeout
+
+        self._created = 0
+        self._lock = threading.Lock()
+        self._idle = LifoQueue()
+        self._local = threading.local()
+        self._server_timezone = None
+
+    def _create_client(self) -> ClickhouseClient:
+        return ClickhouseClient('localhost',
+                                database=self.db,
+                                connect_timeout=clickhouse_option('connect_timeout', 10),
+                                send_receive_timeout=self.timeout,
+                                settings={'max_execution_time': int(self.timeout)})
+
+    def _acquire(self) -> ClickhouseClient:
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._create_client()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except Empty:
+            raise TimeoutError(f'no free clickhouse connection to {self.db} in {self.timeout} s')
+
+    @contextmanager
+    def checkout(self):
+        client = getattr(self._local, 'client', None)
+        if client is not None:
+            self._local.depth += 1
+            try:
+                yield client
+            finally:
+                self._local.depth -= 1
+            return
+
+        client = self._acquire()
+        self._local.client = client
+        self._local.depth = 1
+        try:
+            yield client
+        finally:
+            self._local.client = None
+            self._local.depth = 0
+            self._idle.put(client)
+
+    def execute(self, *args, **kwargs):
+        with self.checkout() as client:
+            return client.execute(*args, **kwargs)
+
+    @property
+    def server_timezone(self) -> str:
+        if self._server_timezone is None:
+            self._server_timezone = self.execute('SELECT timezone()')[0][0]
+        return self._server_timezone
+
+
+def get_clickhouse(db: str) -> ClickhousePool:
+    with _pools_lock:
+        if db not in _pools:
+            _pools[db] = ClickhousePool(db,
+                                        size=clickhouse_option('pool_size', 4),
+                                        timeout=clickhouse_option('timeout', 30))
+        return _pools[db]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _pools_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=clickhouse_option('pool_size', 4),
+                                           thread_name_prefix='clickhouse')
+        return _executor
 
 
 class ClickhouseDatabase:
     def __init__(self, db: str):
         self.db = get_clickhouse(db)
 
-        self.server_timezone = self.db.execute('SELECT timezone()')[0][0]
+        self.server_timezone = self.db.server_timezone
         self.logger = logging.getLogger(self.__class__.__name__)
 
     def query(self, *args, **kwargs):
@@ -37,3 +147,15 @@ class ClickhouseDatabase:
             self.logger.debug(args[0] if len(args) == 1 else args[0] % args[1])
 
         return result
+
+    async def query_async(self, *args, **kwargs):
+        return await self.run_async(self.query, *args, **kwargs)
+
+    @staticmethod
+    async def run_async(f, *args, **kwargs):
+        """
+        Runs f (a query or any method doing queries) on the clickhouse executor,
+        so that the event loop is not blocked.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), partial(f, *args, **kwargs))
@@ -1,17 +1,136 @@
 from time import time
-from datetime import datetime, timedelta
+from bisect import bisect_right
+from threading import Lock
+from datetime import datetime, date, timedelta
 from typing import Optional
-from collections import namedtuple
 
-from .clickhouse import ClickhouseDatabase
+import numpy as np
+
+from .clickhouse import ClickhouseDatabase, clickhouse_option
 
 
 IntervalList = list[list[Optional[datetime]]]
 
+# Senders may publish statuses only on change (see DeadbandFilter), so a sample is
+# considered valid until the next one, but no longer than this. It has to be longer
+# than the sender's heartbeat (mqtt.inverter.heartbeat), otherwise steady consumption
+# is lost; it's overridden by clickhouse.fill_max_gap (in seconds).
+FillMaxGap = timedelta(minutes=15)
+
+# Ranges longer than this are computed using hourly energy aggregates.
+RollupMinRange = timedelta(days=2)
+
+# Hourly energy aggregates are computed by this much of raw data at once.
+EnergyRollupStep = timedelta(days=7)
+
+# Statuses may arrive late (in batches, for example), so ranges closer to now than
+# this are never cached.
+IntervalCacheDelay = timedelta(hours=1)
+
+# Max number of condition pairs to cache change points for.
+IntervalCacheMaxSize = 16
+
+
+class _ConditionChanges:
+    lo: datetime
+    hi: datetime
+    points: list[tuple]
+
+    def __init__(self, lo: datetime, hi: datetime, points: list[tuple]):
+        self.lo = lo
+        self.hi = hi
+        self.points = points
+
+
+_interval_cache: dict[tuple[str, str], _ConditionChanges] = {}
+_interval_cache_lock = Lock()
+
+# end of the range status_energy_hourly is filled for
+_energy_rollup_hi: Optional[datetime] = None
+_energy_rollup_lock = Lock()
+
+
+def _floor_hour(dt: datetime) -> datetime:
+    # on the unix time scale, as status_energy_hourly is, which is the same as
+    # local hours, unless the UTC offset isn't a whole number of hours
+    return datetime.fromtimestamp(int(dt.timestamp()) // 3600 * 3600)
+
+
+def _ceil_hour(dt: datetime) -> datetime:
+    floor = _floor_hour(dt)
+    return floor if floor == dt else floor + timedelta(hours=1)
+
+
+_status_insert_sql = """INSERT INTO status (
+    ClientTime,
+    ReceivedTime,
+    HomeID,
+    GridVoltage,
+    GridFrequency,
+    ACOutputVoltage,
+    ACOutputFrequency,
+    ACOutputApparentPower,
+    ACOutputActivePower,
+    OutputLoadPercent,
+    BatteryVoltage,
+    BatteryVoltageSCC,
+    BatteryVoltageSCC2,
+    BatteryDischargingCurrent,
+    BatteryChargingCurrent,
+    BatteryCapacity,
+    HeatSinkTemp,
+    MPPT1ChargerTemp,
+    MPPT2ChargerTemp,
+    PV1InputPower,
+    PV2InputPower,
+    PV1InputVoltage,
+    PV2InputVoltage,
+    MPPT1ChargerStatus,
+    MPPT2ChargerStatus,
+    BatteryPowerDirection,
+    DCACPowerDirection,
+    LinePowerDirection,
+    LoadConnected) VALUES"""
+
+# columns of status that follow ClientTime, ReceivedTime and HomeID
+_status_columns = tuple(c.strip() for c in _status_insert_sql[_status_insert_sql.index('(')+1:
+                                                              _status_insert_sql.index(')')].split(','))[3:]
+
+# add_status() arguments that follow ClientTime, ReceivedTime and HomeID, in the column order
+_status_fields = (
+    'grid_voltage',
+    'grid_freq',
+    'ac_output_voltage',
+    'ac_output_freq',
+    'ac_output_apparent_power',
+    'ac_output_active_power',
+    'output_load_percent',
+    'battery_voltage',
+    'battery_voltage_scc',
+    'battery_voltage_scc2',
+    'battery_discharge_current',
+    'battery_charge_current',
+    'battery_capacity',
+    'inverter_heat_sink_temp',
+    'mppt1_charger_temp',
+    'mppt2_charger_temp',
+    'pv1_input_power',
+    'pv2_input_power',
+    'pv1_input_voltage',
+    'pv2_input_voltage',
+    'mppt1_charger_status',
+    'mppt2_charger_status',
+    'battery_power_direction',
+    'dc_ac_power_direction',
+    'line_power_direction',
+    'load_connected'
+)
+
 
 class InverterDatabase(ClickhouseDatabase):
-    def __init__(self):
-        super().__init__('solarmon')
+    def __init__(self, db: str = 'solarmon'):
+        super().__init__(db)
+        self.fill_max_gap = timedelta(seconds=clickhouse_option('fill_max_gap', FillMaxGap.total_seconds()))
 
     def add_generation(self, home_id: int, client_time: int, watts: int) -> None:
         self.db.execute(
@@ -47,36 +166,7 @@ class InverterDatabase(ClickhouseDatabase):
                    dc_ac_power_direction: int,
                    line_power_direction: int,
                    load_connected: int) -> None:
-        self.db.execute("""INSERT INTO status (
-            ClientTime,
-            ReceivedTime,
-            HomeID,
-            GridVoltage,
-            GridFrequency,
-            ACOutputVoltage,
-            ACOutputFrequency,
-            ACOutputApparentPower,
-            ACOutputActivePower,
-            OutputLoadPercent,
-            BatteryVoltage,
-            BatteryVoltageSCC,
-            BatteryVoltageSCC2,
-            BatteryDischargingCurrent,
-            BatteryChargingCurrent,
-            BatteryCapacity,
-            HeatSinkTemp,
-            MPPT1ChargerTemp,
-            MPPT2ChargerTemp,
-            PV1InputPower,
-            PV2InputPower,
-            PV1InputVoltage,
-            PV2InputVoltage,
-            MPPT1ChargerStatus,
-            MPPT2ChargerStatus,
-            BatteryPowerDirection,
-            DCACPowerDirection,
-            LinePowerDirection,
-            LoadConnected) VALUES""", [[
+        self.db.execute(_status_insert_sql, [[
             client_time,
             round(time()),
             home_id,
@@ -108,61 +198,281 @@ class InverterDatabase(ClickhouseDatabase):
             load_connected
         ]])
 
+    def add_status_batch(self, home_id: int, statuses: list[dict]) -> None:
+        received_time = round(time())
+        rows = []
+        for s in statuses:
+            row = [s['client_time'], received_time, home_id]
+            row.extend(s[field] for field in _status_fields)
+            rows.append(row)
+
+        self.db.execute(_status_insert_sql, rows)
+
     def get_consumed_energy(self, dt_from: datetime, dt_to: datetime) -> float:
-        rows = self.query('SELECT ClientTime, ACOutputActivePower FROM status'
+        # For long ranges, whole hours are taken from status_energy_hourly (see
+        # doc/database.md), and only the edges are integrated from raw data.
+        end = min(dt_to, datetime.now())
+        if end - dt_from < RollupMinRange:
+            return self._integrate_consumed_energy(dt_from, dt_to)
+
+        h_from = _ceil_hour(dt_from)
+        h_to = min(_floor_hour(end), self._update_energy_rollup())
+        if h_to <= h_from:
+            return self._integrate_consumed_energy(dt_from, dt_to)
+
+        return self._integrate_consumed_energy(dt_from, h_from) \
+            + self._get_rollup_energy(h_from, h_to) \
+            + self._integrate_consumed_energy(h_to, dt_to)
+
+    def _energy_segments_sql(self) -> str:
+        # Every sample holds until the next one, but not longer than fill_max_gap,
+        # and the last one holds until the end of the range. The last sample published
+        # before the range is carried over to it, keeping its own time for the limit.
+        # Segments are cut to [from_ts, end], so integrals of adjacent ranges add up.
+        return """SELECT greatest(t, %(from_ts)s) AS s, least(next_t, t + %(gap)s, %(end)s) AS e, w
+            FROM (
+                SELECT t, w, leadInFrame(t, 1, toInt64(%(end)s)) OVER (ORDER BY t, w ROWS BETWEEN CURRENT ROW AND 1 FOLLOWING) AS next_t
+                FROM (
+                    SELECT toInt64(toUnixTimestamp(ClientTime)) AS t, toFloat64(ACOutputActivePower) AS w FROM status
+                    WHERE ClientTime >= %(from)s AND ClientTime <= %(to)s
+                    UNION ALL
+                    SELECT t, w FROM (
+                        SELECT toInt64(toUnixTimestamp(ClientTime)) AS t, toFloat64(ACOutputActivePower) AS w FROM status
+                        WHERE ClientTime < %(from)s AND ClientTime >= %(fill_from)s
+                        ORDER BY ClientTime DESC LIMIT 1
+                    )
+                )
+            )
+            WHERE e > s"""
+
+    def _energy_segments_params(self, dt_from: datetime, dt_to: datetime, end: datetime) -> dict:
+        return {
+            'from': dt_from,
+            'to': dt_to,
+            'fill_from': dt_from - self.fill_max_gap,
+            'from_ts': int(dt_from.timestamp()),
+            'end': int(end.timestamp()),
+            'gap': int(self.fill_max_gap.total_seconds())
+        }
+
+    def _integrate_consumed_energy(self, dt_from: datetime, dt_to: datetime) -> float:
+        if dt_to <= dt_from:
+            return 0
+
+        end = min(dt_to, datetime.now())
+        rows = self.query(f'SELECT sum(w * (e - s)) / 3600 FROM ({self._energy_segments_sql()})',
+                          self._energy_segments_params(dt_from, dt_to, end))
+        return float(rows[0][0] or 0)
+
+    def _update_energy_rollup(self) -> datetime:
+        """
+        Fills status_energy_hourly up to the last hour that is considered closed
+        (see IntervalCacheDelay) and returns the end of the filled range.
+        """
+        global _energy_rollup_hi
+        closed = _floor_hour(datetime.now() - IntervalCacheDelay)
+
+        with _energy_rollup_lock:
+            if _energy_rollup_hi is None:
+                # hours after the last stored one have no rows by definition, even
+                # if they have been filled already, so it's safe to fill them again
+                rows = self.query('SELECT toInt64(toUnixTimestamp(max(Hour))), count() FROM status_energy_hourly')
+                if rows[0][1]:
+                    _energy_rollup_hi = datetime.fromtimestamp(rows[0][0]) + timedelta(hours=1)
+                else:
+                    rows = self.query('SELECT toInt64(toUnixTimestamp(min(ClientTime))), count() FROM status')
+                    _energy_rollup_hi = _floor_hour(datetime.fromtimestamp(rows[0][0])) if rows[0][1] else closed
+
+            # in steps, so that filling the whole history doesn't hit the query timeout
+            while closed > _energy_rollup_hi:
+                hi = min(closed, _energy_rollup_hi + EnergyRollupStep)
+                # a segment spanning several hours is split between them
+                self.query(f"""INSERT INTO status_energy_hourly (Hour, Wh)
+                    SELECT toDateTime(h * 3600), sum(w * (least(e, (h + 1) * 3600) - greatest(s, h * 3600))) / 3600
+                    FROM (
+                        SELECT s, e, w, toInt64(arrayJoin(range(toUInt64(intDiv(s, 3600)), toUInt64(intDiv(e - 1, 3600) + 1)))) AS h
+                        FROM ({self._energy_segments_sql()})
+                    )
+                    GROUP BY h""", self._energy_segments_params(_energy_rollup_hi, hi, hi))
+                _energy_rollup_hi = hi
+
+            return _energy_rollup_hi
+
+    def _get_rollup_energy(self, dt_from: datetime, dt_to: datetime) -> float:
+        if dt_to <= dt_from:
+            return 0
+
+        # FINAL, as two processes may fill the same hours at once
+        rows = self.query("""SELECT sum(Wh) FROM status_energy_hourly FINAL
+            WHERE Hour >= toDateTime(%(from_ts)s) AND Hour < toDateTime(%(to_ts)s)""",
+                          {'from_ts': int(dt_from.timestamp()), 'to_ts': int(dt_to.timestamp())})
+        return float(rows[0][0] or 0)
+
+    def get_status_series(self,
+                          dt_from: datetime,
+                          dt_to: datetime,
+                          fields: list[str],
+                          step: int) -> list[tuple]:
+        """
+        Returns a regular time series with `step` seconds resolution, reconstructed
+        from possibly sparse (change-driven) samples by forward-filling. Rows are
+        (time, *fields); points farther than fill_max_gap from the last sample
+        are left out.
+        """
+        for field in fields:
+            if field not in _status_columns:
+                raise ValueError(f'unknown status column: {field}')
+        if step < 1:
+            raise ValueError('step must be positive')
+
+        columns = ', '.join(['ClientTime'] + fields)
+        rows = self.query(f'SELECT {columns} FROM status'
                           ' WHERE ClientTime >= %(from)s AND ClientTime <= %(to)s'
                           ' ORDER BY ClientTime', {'from': dt_from, 'to': dt_to})
-        prev_time = None
-        prev_wh = 0
+        rows = self._forward_fill_head(rows, dt_from, *fields)
+
+        series = []
+        i = 0
+        last = None
+        t = dt_from
+        while t <= dt_to:
+            while i < len(rows) and rows[i][0] <= t:
+                last = rows[i]
+                i += 1
+            if last is not None and t - last[0] <= self.fill_max_gap:
+                series.append((t, *last[1:]))
+            t += timedelta(seconds=step)
 
-        ws = 0  # watt-seconds
-        for t, wh in rows:
-            if prev_time is not None:
-                n = (t - prev_time).total_seconds()
-                ws += prev_wh * n
+        return series
 
-            prev_time = t
-            prev_wh = wh
+    def _forward_fill_head(self, rows: list, dt_from: datetime, *fields: str) -> list:
+        # prepend the last sample published before the range, it may still hold at its
+        # beginning; it keeps its own time, so it's not held longer than fill_max_gap
+        if rows and rows[0][0] == dt_from:
+            return rows
 
-        return ws / 3600  # convert to watt-hours
+        columns = ', '.join(['ClientTime'] + list(fields))
+        prev = self.query(f'SELECT {columns} FROM status'
+                          ' WHERE ClientTime < %(from)s AND ClientTime >= %(min)s'
+                          ' ORDER BY ClientTime DESC LIMIT 1',
+                          {'from': dt_from, 'min': dt_from - self.fill_max_gap})
+        if not prev:
+            return rows
+
+        return [prev[0]] + list(rows)
 
     def get_intervals_by_condition(self,
                                    dt_from: datetime,
                                    dt_to: datetime,
                                    cond_start: str,
                                    cond_end: str) -> IntervalList:
-        rows = None
-        ranges = [[None, None]]
+        ranges = []
+        current = None
+
+        for t, is_start, is_end in self._get_condition_changes(dt_from, dt_to, cond_start, cond_end):
+            if current is None:
+                if is_start:
+                    current = [t, None]
+            elif is_end:
+                current[1] = t
+                ranges.append(current)
+                current = None
+
+        if current is not None:
+            current[1] = dt_to - timedelta(seconds=1)
+            ranges.append(current)
+
+        return ranges
 
-        while rows is None or len(rows) > 0:
-            if ranges[len(ranges)-1][0] is None:
-                condition = cond_start
-                range_idx = 0
+    def _get_condition_changes(self,
+                               dt_from: datetime,
+                               dt_to: datetime,
+                               cond_start: str,
+                               cond_end: str) -> list[tuple]:
+        # Change points of both conditions for already closed time ranges are cached,
+        # so repeated queries only hit the database for the new data. Calls may come
+        # from several threads, so the cache is only read and changed under the lock.
+        closed = datetime.now() - IntervalCacheDelay
+        key = (cond_start, cond_end)
+
+        with _interval_cache_lock:
+            cache = _interval_cache.get(key)
+            if cache is not None and cache.lo <= dt_from <= cache.hi:
+                cache_hi = cache.hi
+                hi = min(dt_to, cache_hi)
+                # (t, 1, 1) goes after any point with the same time
+                points = cache.points[bisect_right(cache.points, (dt_from, 1, 1)):bisect_right(cache.points, (hi, 1, 1))]
             else:
-                condition = cond_end
-                range_idx = 1
+                cache = None
 
-            rows = self.query('SELECT ClientTime FROM status '
-                              f'WHERE ClientTime > %(from)s AND ClientTime <= %(to)s AND {condition}'
-                              ' ORDER BY ClientTime LIMIT 1',
-                              {'from': dt_from, 'to': dt_to})
-            if not rows:
-                break
+        if cache is None:
+            points = self._query_condition_changes(dt_from, dt_to, cond_start, cond_end)
+            if dt_from < closed:
+                self._cache_condition_changes(key, dt_from, min(dt_to, closed), points)
+            return points
 
-            row = rows[0]
+        # If dt_from falls in the middle of a run, the first row after dt_from is not a change point,
+        # but an interval can start at it.
+        head = self._query_condition_changes(dt_from, points[0][0] if points else hi, cond_start, cond_end, limit=1)
+        if head and (not points or head[0][0] < points[0][0]):
+            points.insert(0, head[0])
 
-            ranges[len(ranges) - 1][range_idx] = row[0]
-            if range_idx == 1:
-                ranges.append([None, None])
+        if dt_to > cache_hi:
+            tail = self._query_condition_changes(cache_hi, dt_to, cond_start, cond_end)
+            points.extend(tail)
 
-            dt_from = row[0]
+            if closed > cache_hi:
+                new_hi = min(dt_to, closed)
+                with _interval_cache_lock:
+                    # unless another call has extended or replaced it meanwhile
+                    if _interval_cache.get(key) is cache and cache.hi == cache_hi:
+                        cache.points.extend(p for p in tail if p[0] <= new_hi)
+                        cache.hi = new_hi
 
-        if ranges[len(ranges)-1][0] is None:
-            ranges.pop()
-        elif ranges[len(ranges)-1][1] is None:
-            ranges[len(ranges)-1][1] = dt_to - timedelta(seconds=1)
+        return points
 
-        return ranges
+    @staticmethod
+    def _cache_condition_changes(key: tuple[str, str], lo: datetime, hi: datetime, points: list[tuple]):
+        points = [p for p in points if p[0] <= hi]
+        with _interval_cache_lock:
+            cache = _interval_cache.get(key)
+            if cache is not None and lo < cache.lo <= hi < cache.hi:
+                # the new range overlaps the beginning of the cached one, so join them;
+                # a repeated state at the joint is harmless to get_intervals_by_condition()
+                points += [p for p in cache.points if p[0] > hi]
+                hi = cache.hi
+            elif cache is not None and hi - lo < cache.hi - cache.lo:
+                # don't replace a wider range with a narrower one
+                return
+
+            _interval_cache.pop(key, None)
+            _interval_cache[key] = _ConditionChanges(lo, hi, points)
+            while len(_interval_cache) > IntervalCacheMaxSize:
+                # the one cached the earliest
+                del _interval_cache[next(iter(_interval_cache))]
+
+    def _query_condition_changes(self,
+                                 dt_from: datetime,
+                                 dt_to: datetime,
+                                 cond_start: str,
+                                 cond_end: str,
+                                 limit: Optional[int] = None) -> list[tuple]:
+        # Returns (time, is_start, is_end) only for rows where the pair of conditions
+        # differs from the previous row, plus the very first row of the range.
+        sql = f"""SELECT t, intDiv(s, 2), modulo(s, 2) FROM (
+                SELECT ClientTime AS t,
+                       toInt16(({cond_start}) * 2 + ({cond_end})) AS s,
+                       lagInFrame(s, 1, toInt16(-1)) OVER (ORDER BY ClientTime ROWS BETWEEN 1 PRECEDING AND CURRENT ROW) AS prev_s
+                FROM status
+                WHERE ClientTime > %(from)s AND ClientTime <= %(to)s
+            )
+            WHERE s != prev_s
+            ORDER BY t"""
+        if limit is not None:
+            sql += f' LIMIT {limit}'
+
+        return [(t, bool(is_start), bool(is_end))
+                for t, is_start, is_end in self.query(sql, {'from': dt_from, 'to': dt_to})]
 
     def get_grid_connected_intervals(self, dt_from: datetime, dt_to: datetime) -> IntervalList:
         return self.get_intervals_by_condition(dt_from, dt_to, 'GridFrequency > 0', 'GridFrequency = 0')
@@ -174,39 +484,70 @@ class InverterDatabase(ClickhouseDatabase):
                                                "LinePowerDirection != 'Input'")
 
     def get_grid_consumed_energy(self, dt_from: datetime, dt_to: datetime) -> float:
-        PrevData = namedtuple('PrevData', 'time, pd, bat_chg, bat_dis, wh')
-
-        ws = 0  # watt-seconds
-        amps = 0  # amper-seconds
+        return self.get_grid_consumed_energy_breakdown(dt_from, dt_to)['wh']
 
+    def get_grid_consumed_energy_breakdown(self, dt_from: datetime, dt_to: datetime) -> dict:
+        """
+        Returns energy consumed from the grid in total, per grid-used interval
+        and per day (a segment between two samples goes to the day it starts in).
+        """
         intervals = self.get_grid_used_intervals(dt_from, dt_to)
-        for dt_start, dt_end in intervals:
-            fields = ', '.join([
-                'ClientTime',
-                'DCACPowerDirection',
-                'BatteryChargingCurrent',
-                'BatteryDischargingCurrent',
-                'ACOutputActivePower'
-            ])
-            rows = self.query(f'SELECT {fields} FROM status'
-                              ' WHERE ClientTime >= %(from)s AND ClientTime < %(to)s ORDER BY ClientTime',
-                              {'from': dt_start, 'to': dt_end})
-
-            prev = PrevData(time=None, pd=None, bat_chg=None, bat_dis=None, wh=None)
-            for ct, pd, bat_chg, bat_dis, wh in rows:
-                if prev.time is not None:
-                    n = (ct-prev.time).total_seconds()
-                    ws += prev.wh * n
-
-                    if pd == 'DC/AC':
-                        amps -= prev.bat_dis * n
-                    elif pd == 'AC/DC':
-                        amps += prev.bat_chg * n
-
-                prev = PrevData(time=ct, pd=pd, bat_chg=bat_chg, bat_dis=bat_dis, wh=wh)
-
-        amps /= 3600
-        wh = ws / 3600
-        wh += amps*48
-
-        return wh
+        result = {
+            'wh': 0.,
+            'intervals': [[dt_start, dt_end, 0.] for dt_start, dt_end in intervals],
+            'days': []
+        }
+        if not intervals:
+            return result
+
+        # rows of all intervals in one go; intervals only contain rows with
+        # LinePowerDirection = 'Input', and rows in between them are skipped below
+        columns = self.query("""SELECT
+                toInt64(toUnixTimestamp(ClientTime)),
+                toInt64(toUInt16(toDate(ClientTime))),
+                DCACPowerDirection,
+                BatteryChargingCurrent,
+                BatteryDischargingCurrent,
+                ACOutputActivePower
+            FROM status
+            WHERE ClientTime >= %(from)s AND ClientTime < %(to)s AND LinePowerDirection = 'Input'
+            ORDER BY ClientTime""", {
+            'from': intervals[0][0],
+            'to': intervals[-1][1]
+        }, columnar=True)
+        if not columns or len(columns[0]) < 2:
+            return result
+
+        t = np.array(columns[0], dtype=np.int64)
+        day = np.array(columns[1], dtype=np.int64)
+        pd = np.array(columns[2])
+        bat_chg = np.array(columns[3], dtype=np.float64)
+        bat_dis = np.array(columns[4], dtype=np.float64)
+        w = np.array(columns[5], dtype=np.float64)
+
+        # index of the interval each row belongs to, -1 if none
+        starts = np.array([int(i[0].timestamp()) for i in intervals], dtype=np.int64)
+        ends = np.array([int(i[1].timestamp()) for i in intervals], dtype=np.int64)
+        idx = np.searchsorted(starts, t, side='right') - 1
+        idx[(idx < 0) | (t >= ends[np.maximum(idx, 0)])] = -1
+
+        # a segment spans from a row to the next one of the same interval and is
+        # valued by the first row, except the direction of the battery current,
+        # which is taken from the second one
+        same = (idx[:-1] == idx[1:]) & (idx[:-1] >= 0)
+        n = np.where(same, t[1:] - t[:-1], 0)
+
+        amps = np.where(pd[1:] == 'DC/AC', -bat_dis[:-1], 0.) + np.where(pd[1:] == 'AC/DC', bat_chg[:-1], 0.)
+        wh = (w[:-1] + amps * 48) * n / 3600
+
+        per_interval = np.bincount(np.where(same, idx[:-1], 0), weights=wh, minlength=len(intervals))
+        days, day_idx = np.unique(day[:-1][same], return_inverse=True)
+        per_day = np.bincount(day_idx, weights=wh[same], minlength=len(days))
+
+        epoch = date(1970, 1, 1)
+        result['wh'] = float(wh.sum())
+        for i, item in enumerate(result['intervals']):
+            item[2] = float(per_interval[i])
+        result['days'] = [[epoch + timedelta(days=int(d)), float(per_day[i])]
+                          for i, d in enumerate(days)]
+        return result
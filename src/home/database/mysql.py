@@ -1,30 +1,160 @@
 import time
 import logging
+import threading
 
+from queue import LifoQueue, Empty
+from contextlib import contextmanager
 from mysql.connector import connect, MySQLConnection, Error
 from typing import Optional
 from ..config import config
 
-link: Optional[MySQLConnection] = None
+pool: Optional['MySQLPool'] = None
+pool_lock = threading.Lock()
 logger = logging.getLogger(__name__)
 
 datetime_fmt = '%Y-%m-%d %H:%M:%S'
 
+# A connection that has been idle longer than this is pinged (and reconnected
+# if needed) on checkout. MySQL drops connections after wait_timeout (8 hours
+# by default), so a few minutes is more than enough.
+IdleCheckInterval = 60
 
-def get_mysql() -> MySQLConnection:
-    global link
 
-    if link is not None:
-        return link
+class _PooledConnection:
+    def __init__(self, cnx: MySQLConnection):
+        self.cnx = cnx
+        self.last_used = time.monotonic()
+        self.prepared = {}
 
-    link = connect(
-        host=config['mysql']['host'],
-        user=config['mysql']['user'],
-        password=config['mysql']['password'],
-        database=config['mysql']['database'],
-    )
-    link.time_zone = '+01:00'
-    return link
+
+class MySQLPool:
+    """
+    Bounded pool of MySQL connections. A connection is checked out for the
+    duration of a cursor; nested checkouts from the same thread get the same
+    connection, so cursor() and commit() may be combined freely.
+    """
+
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+
+        self._created = 0
+        self._lock = threading.Lock()
+        self._idle = LifoQueue()
+        self._local = threading.local()
+
+    def _connect(self) -> _PooledConnection:
+        return _PooledConnection(connect(
+            host=config['mysql']['host'],
+            user=config['mysql']['user'],
+            password=config['mysql']['password'],
+            database=config['mysql']['database'],
+            time_zone='+01:00'
+        ))
+
+    def _acquire(self) -> _PooledConnection:
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise TimeoutError(f'no free mysql connection in {self.timeout} s')
+
+        if time.monotonic() - conn.last_used > IdleCheckInterval:
+            # prepared statements don't survive reconnection, free them while
+            # the connection may still be alive
+            self._close_prepared(conn)
+            try:
+                conn.cnx.ping(reconnect=True, attempts=2)
+            except Error:
+                self._discard(conn)
+                raise
+
+        return conn
+
+    def _release(self, conn: _PooledConnection, failed: bool):
+        # autocommit is off, so even reads leave a transaction open, and the next
+        # checkout would see its old snapshot; end it unless it's been committed
+        if failed or conn.cnx.in_transaction:
+            try:
+                conn.cnx.rollback()
+            except Error as e:
+                logger.exception(e)
+                self._discard(conn)
+                return
+
+        conn.last_used = time.monotonic()
+        self._idle.put(conn)
+
+    @staticmethod
+    def _close_prepared(conn: _PooledConnection):
+        for cursor in conn.prepared.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        conn.prepared = {}
+
+    def _discard(self, conn: _PooledConnection):
+        self._close_prepared(conn)
+        try:
+            conn.cnx.close()
+        except Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def checkout(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        failed = False
+        try:
+            yield conn
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn, failed)
+
+    def current(self) -> _PooledConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            raise RuntimeError('no mysql connection checked out by this thread')
+        return conn
+
+
+def get_mysql() -> MySQLPool:
+    global pool
+
+    with pool_lock:
+        if pool is None:
+            pool = MySQLPool(size=config['mysql'].get('pool_size', 4),
+                             timeout=config['mysql'].get('pool_timeout', 30))
+        return pool
 
 
 def mysql_now() -> str:
@@ -33,15 +163,28 @@ def mysql_now() -> str:
 
 class MySQLDatabase:
     def __init__(self):
-        self.db = get_mysql()
+        self.pool = get_mysql()
 
+    @contextmanager
     def cursor(self, **kwargs):
-        try:
-            self.db.ping(reconnect=True, attempts=2)
-        except Error as e:
-            logger.exception(e)
-            self.db = get_mysql()
-        return self.db.cursor(**kwargs)
+        with self.pool.checkout() as conn:
+            cursor = conn.cnx.cursor(**kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def prepared_cursor(self, name: str):
+        """
+        Yields a cursor for server-side prepared statements. It's kept per
+        connection, so a statement it executes repeatedly is prepared only once.
+        """
+        with self.pool.checkout() as conn:
+            if name not in conn.prepared:
+                conn.prepared[name] = conn.cnx.cursor(prepared=True)
+            yield conn.prepared[name]
 
     def commit(self):
-        self.db.commit()
+        # must be called while a cursor is in use
+        self.pool.current().cnx.commit()
@@ -1,6 +1,6 @@
 from time import time
 from datetime import datetime
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 from .clickhouse import ClickhouseDatabase
 from ..api.types import TemperatureSensorLocation
 
@@ -25,6 +25,15 @@ def get_temperature_table(sensor: TemperatureSensorLocation) -> str:
         return 'temp_spb1'
 
 
+# (period in seconds, table suffix) of rollups maintained for every temperature
+# table (see doc/database.md), from the coarsest one
+TemperatureRollups = (
+    (3600, '_1h'),
+    (600, '_10m'),
+    (60, '_1m'),
+)
+
+
 class SensorsDatabase(ClickhouseDatabase):
     def __init__(self):
         super().__init__('home')
@@ -54,16 +63,60 @@ class SensorsDatabase(ClickhouseDatabase):
     def get_temperature_recordings(self,
                                    sensor: TemperatureSensorLocation,
                                    time_range: Tuple[datetime, datetime],
-                                   home_id=1) -> List[tuple]:
+                                   home_id=1,
+                                   resolution: Optional[int] = None,
+                                   ranges=False) -> List[tuple]:
+        """
+        Returns (time, temp, humidity) rows, extended with (temp_min, temp_max,
+        humidity_min, humidity_max) if ranges is set. If resolution (in seconds)
+        is given and it's at least a minute, values are averaged over periods of
+        that length, rounded down to a multiple of the coarsest suitable rollup
+        they are taken from. Raw rows have min and max equal to the value.
+        """
         table = get_temperature_table(sensor)
+        dt_from, dt_to = time_range
+
+        for period, suffix in TemperatureRollups:
+            if resolution is not None and resolution >= period:
+                # buckets made of whole rollup periods, each with the same number of them
+                rows = self._get_temperature_rollup(table+suffix, dt_from, dt_to, resolution // period * period)
+                return rows if ranges else [row[:3] for row in rows]
+
         sql = f"""SELECT ClientTime, Temperature, RelativeHumidity 
             FROM {table}
             WHERE ClientTime >= %(from)s AND ClientTime <= %(to)s
             ORDER BY ClientTime"""
-        dt_from, dt_to = time_range
 
         data = self.query(sql, {
             'from': dt_from,
             'to': dt_to
         })
+        if ranges:
+            return [(date, temp/100, humidity/100, temp/100, temp/100, humidity/100, humidity/100)
+                    for date, temp, humidity in data]
         return [(date, temp/100, humidity/100) for date, temp, humidity in data]
+
+    def _get_temperature_rollup(self,
+                                table: str,
+                                dt_from: datetime,
+                                dt_to: datetime,
+                                resolution: int) -> List[tuple]:
+        sql = f"""SELECT
+                toStartOfInterval(Time, INTERVAL {int(resolution)} SECOND) AS T,
+                sum(TemperatureSum) / sum(Samples),
+                sum(RelativeHumiditySum) / sum(Samples),
+                min(TemperatureMin),
+                max(TemperatureMax),
+                min(RelativeHumidityMin),
+                max(RelativeHumidityMax)
+            FROM {table}
+            WHERE Time >= %(from)s AND Time <= %(to)s
+            GROUP BY T
+            ORDER BY T"""
+
+        data = self.query(sql, {
+            'from': dt_from,
+            'to': dt_to
+        })
+        return [(date, temp/100, humidity/100, temp_min/100, temp_max/100, humidity_min/100, humidity_max/100)
+                for date, temp, humidity, temp_min, temp_max, humidity_min, humidity_max in data]
@@ -1,2 +1,2 @@
 from .http import serve, ok, routes, HTTPServer
-from aiohttp.web import FileResponse, StreamResponse, Request, Response
+from aiohttp.web import FileResponse, StreamResponse, Request, Response, HTTPNotFound
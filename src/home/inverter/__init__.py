@@ -1,3 +1,6 @@
 from .monitor import InverterMonitor
+from .journal import MonitorJournal
 from .inverter_wrapper import wrapper_instance
+from .poller import InverterPoller, InverterSnapshot, poller_instance
 from .util import beautify_table
+from .aio import AsyncInverterClient
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+
+from collections import deque
+from typing import Optional
+from inverterd import Format, InverterError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncInverterClient:
+    """
+    asyncio-native inverterd client. The connection is persistent and
+    requests are pipelined: they are written as soon as they are made, and
+    responses, which inverterd sends in order, are matched with a FIFO of
+    futures. If the connection is lost, it's re-established in the background
+    with exponential backoff.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._format = None
+        self._pending = deque()
+        self._connected = asyncio.Event()
+        self._read_task = None
+        self._reconnect_task = None
+        self._closing = False
+
+    async def connect(self):
+        self._closing = False
+        await self._open()
+
+    async def close(self):
+        self._closing = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self._writer:
+            self._writer.close()
+        if self._read_task:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+
+    async def exec(self, command: str, arguments: tuple = (), format=Format.JSON):
+        return (await self.exec_many([(command, arguments)], format=format))[0]
+
+    async def exec_many(self, commands: list[tuple[str, tuple]], format=Format.JSON) -> list:
+        """Sends all commands at once and waits for all responses."""
+        await asyncio.wait_for(self._connected.wait(), self.timeout)
+
+        futures = []
+        format_changed = self._format != format
+        if format_changed:
+            futures.append(self._request(f'format {format.value}'))
+            self._format = format
+
+        for command, arguments in commands:
+            futures.append(self._request(' '.join(['exec', command, *map(str, arguments)])))
+
+        responses = await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        if format_changed:
+            responses = responses[1:]
+        if format == Format.JSON:
+            responses = [json.loads(r) for r in responses]
+        return responses
+
+    def _request(self, line: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(f'{line}\r\n'.encode('utf-8'))
+        return future
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._format = None
+        self._read_task = asyncio.create_task(self._read_loop())
+        self._connected.set()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                response = await self._reader.readuntil(b'\r\n\r\n')
+                status, _, data = response[:-4].decode('utf-8').partition('\r\n')
+                if not self._pending:
+                    logger.warning(f'unexpected response: {response}')
+                    continue
+
+                future = self._pending.popleft()
+                if future.done():
+                    continue
+                if status == 'ok':
+                    future.set_result(data)
+                else:
+                    future.set_exception(InverterError(data))
+
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            if not self._closing:
+                logger.warning(f'connection lost: {str(e)}')
+
+        finally:
+            self._connected.clear()
+            self._writer.close()
+            while self._pending:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError('connection to inverterd lost'))
+
+            if not self._closing:
+                self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                await self._open()
+                logger.info('reconnected')
+                return
+            except OSError as e:
+                logger.warning(f'reconnect failed: {str(e)}')
+                delay = min(delay * 2, 60)
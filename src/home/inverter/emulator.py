@@ -1,9 +1,12 @@
 import asyncio
+import json
 import logging
+import random
+import time
 
-from inverterd import Format
+from inverterd import Format, InverterError
 
-from typing import Union
+from typing import Union, Optional, Callable
 from enum import Enum
 from ..util import Addr, stringify
 
@@ -248,8 +251,57 @@ _g_human_readable = {"grid_voltage": "Grid voltage",
                      "wh": "Wh"}
 
 
+class EmulatorStats:
+    """Serial port usage, for measuring how clients contend for the inverter."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.clients = 0
+        self.commands = {}     # command => [count, total wait, max wait]
+        self.busy = 0.
+
+    def record(self, command: str, waited: float, latency: float):
+        if command not in self.commands:
+            self.commands[command] = [0, 0., 0.]
+        c = self.commands[command]
+        c[0] += 1
+        c[1] += waited
+        c[2] = max(c[2], waited)
+        self.busy += latency
+
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.started
+        lines = [f'{elapsed:.0f} s, {self.clients} clients, port busy {self.busy / elapsed * 100:.0f}%']
+        for command, (count, wait_total, wait_max) in sorted(self.commands.items()):
+            lines.append(f'  {command}: {count} ({count / elapsed:.2f}/s),'
+                         f' wait avg {wait_total / count * 1000:.0f} ms, max {wait_max * 1000:.0f} ms')
+        return '\n'.join(lines)
+
+
 class InverterEmulator:
-    def __init__(self, addr: Addr, wait=True):
+    """
+    Fake inverterd. By default it serves static data; with a model (see
+    home/inverter/simulation.py and home/inverter/recording.py) the status
+    follows the model, advanced to
+    clock() on every command, and scenario events are applied on the way.
+    With addr=None, no server is started and the emulator is used in-process
+    through exec(), which mirrors InverterClientWrapper.exec().
+
+    Like the real device, the server executes one command at a time, as
+    there's only one serial port. latency maps commands to the seconds the
+    device takes to answer them ('*' for the rest), randomly varied by
+    +/- jitter (a fraction); exec commands of all clients queue for the port.
+    """
+
+    def __init__(self,
+                 addr: Optional[Addr],
+                 wait=True,
+                 model=None,
+                 scenario=None,
+                 clock: Callable[[], float] = time.time,
+                 latency: Optional[dict[str, float]] = None,
+                 jitter: float = 0,
+                 stats_interval: float = 0):
         self.status = {"grid_voltage": {"unit": "V", "value": 236.3},
                        "grid_freq": {"unit": "Hz", "value": 50.0},
                        "ac_output_voltage": {"unit": "V", "value": 229.9},
@@ -336,13 +388,35 @@ class InverterEmulator:
 
         self.logger = logging.getLogger(self.__class__.__name__)
 
-        host, port = addr
-        asyncio.run(self.run_server(host, port, wait))
+        self.latency = latency or {}
+        self.jitter = jitter
+        self.stats_interval = stats_interval
+        self.stats = EmulatorStats()
+        self._port = None
+        self._stats_task = None
+
+        self.model = model
+        self.scenario = scenario
+        self.clock = clock
+        self._started = clock()
+        self._scenario_pos = 0
+        if model is not None:
+            model.update_rated(self.rated)
+            self.update_model()
+
+        if addr is not None:
+            host, port = addr
+            asyncio.run(self.run_server(host, port, wait))
         # self.max_ac_charge_current = 30
         # self.max_charge_current = 60
         # self.charge_thresholds = [48, 54]
 
     async def run_server(self, host, port, wait: bool):
+        self._port = asyncio.Lock()
+        if self.stats_interval:
+            # the loop only keeps weak references to tasks
+            self._stats_task = asyncio.create_task(self.stats_reporter())
+
         server = await asyncio.start_server(self.client_handler, host, port)
         async with server:
             self.logger.info(f'listening on {host}:{port}')
@@ -385,17 +459,26 @@ class InverterEmulator:
                 w('\r\n')
             w('\r\n')
 
-        request = None
-        while request != 'quit':
+        self.stats.clients += 1
+
+        # Requests are lines. A client may send several without waiting for
+        # responses, they are answered in order.
+        while True:
             try:
-                request = await reader.read(255)
-                if request == b'\x04':
+                request = await reader.readline()
+                if not request or request.startswith(b'\x04'):
                     break
                 request = request.decode('utf-8').strip()
             except Exception:
                 break
 
-            if request.startswith('format '):
+            if request == '':
+                continue
+
+            elif request == 'quit':
+                break
+
+            elif request.startswith('format '):
                 requested_format = request[7:]
                 try:
                     client_fmt = Format(requested_format)
@@ -410,7 +493,7 @@ class InverterEmulator:
                 args = buf[1:]
 
                 try:
-                    return_ok(self.process_command(client_fmt, command, *args))
+                    return_ok(await self.serial_command(client_fmt, command, *args))
                 except ValueError as e:
                     return_error(str(e))
 
@@ -423,11 +506,56 @@ class InverterEmulator:
                 # self.logger.exception(e)
                 pass
 
+        self.stats.clients -= 1
         writer.close()
 
+    async def serial_command(self, fmt: Format, c: str, *args):
+        latency = self.latency.get(c, self.latency.get('*', 0))
+        if latency and self.jitter:
+            latency *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        queued = time.monotonic()
+        async with self._port:
+            waited = time.monotonic() - queued
+            if latency:
+                await asyncio.sleep(latency)
+            try:
+                return self.process_command(fmt, c, *args)
+            finally:
+                self.stats.record(c, waited, latency)
+
+    async def stats_reporter(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.logger.info('stats: ' + self.stats.report())
+
+    def exec(self, command: str, arguments: tuple = (), format=Format.JSON):
+        try:
+            data = self.process_command(format, command, *map(str, arguments))
+        except ValueError as e:
+            raise InverterError(str(e))
+        if format != Format.JSON:
+            return data
+        response = {'result': 'ok'}
+        if data:
+            response['data'] = data
+        # as if it went through the wire, so that callers don't share our dicts
+        return json.loads(stringify(response))
+
+    def update_model(self):
+        if self.model is None:
+            return
+        now = self.clock()
+        if self.scenario is not None:
+            self._scenario_pos = self.scenario.apply(self.model, self._started, now, self._scenario_pos)
+        self.model.advance_to(now)
+        self.model.update_status(self.status)
+
     def process_command(self, fmt: Format, c: str, *args) -> Union[dict, str, list[int], None]:
         ac_charge_currents = [2, 10, 20, 30, 40, 50, 60]
 
+        self.update_model()
+
         if c == 'get-status':
             return self.format_dict(self.status, fmt)
 
@@ -453,10 +581,14 @@ class InverterEmulator:
             if amps not in ac_charge_currents:
                 raise ValueError(f'invalid value: {amps}')
             self.rated['max_ac_charge_current']['value'] = amps
+            if self.model is not None:
+                self.model.ac_charge_current = amps
 
         elif c == 'set-charge-thresholds':
             self.rated['battery_recharge_voltage']['value'] = float(args[0])
             self.rated['battery_redischarge_voltage']['value'] = float(args[1])
+            if self.model is not None:
+                self.model.recharge_v = float(args[0])
 
         elif c == 'set-output-source-priority':
             self.rated['output_source_priority'] = OutputSourcePriority.SolarBatteryUtility if args[0] == 'SBU' else OutputSourcePriority.SolarUtilityBattery
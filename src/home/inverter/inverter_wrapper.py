@@ -15,6 +15,11 @@ class InverterClientWrapper:
         self._inverter = None
         self._host = None
         self._port = None
+        self._format = None
+
+        # incremented by every set-* command, so that cached settings
+        # (see InverterPoller) can be invalidated
+        self.settings_version = 0
 
     def init(self, host: str, port: int):
         self._host = host
@@ -24,15 +29,33 @@ class InverterClientWrapper:
     def create(self):
         self._inverter = InverterClient(host=self._host, port=self._port)
         self._inverter.connect()
+        # format of the connection; it persists between commands, so it's
+        # only sent when it needs to change
+        self._format = None
 
     def exec(self, command: str, arguments: tuple = (), format=Format.JSON):
+        return self.exec_many([(command, arguments)], format=format)[0]
+
+    def exec_many(self, commands: list[tuple[str, tuple]], format=Format.JSON) -> list:
+        """
+        Executes several commands in one locked session, without other
+        threads' commands (or format switches) in between.
+        """
         with _lock:
             try:
-                self._inverter.format(format)
-                response = self._inverter.exec(command, arguments)
-                if format == Format.JSON:
-                    response = json.loads(response)
-                return response
+                if self._format != format:
+                    self._inverter.format(format)
+                    self._format = format
+
+                responses = []
+                for command, arguments in commands:
+                    response = self._inverter.exec(command, arguments)
+                    if command.startswith('set-'):
+                        self.settings_version += 1
+                    if format == Format.JSON:
+                        response = json.loads(response)
+                    responses.append(response)
+                return responses
             except InverterError as e:
                 raise e
             except Exception as e:
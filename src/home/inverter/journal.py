@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import logging
+
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MonitorJournal:
+    """
+    Append-only journal of InverterMonitor state. Every change of the state is
+    written as a JSON line and handed to the OS right away, so it survives a
+    restart of the bot; fsync() is batched, at most one per sync_interval
+    seconds, which bounds what a power loss may take. After max_records lines,
+    the journal is compacted to the last one.
+
+    Only the last record matters on startup, and it's found by reading the
+    tail of the file, so recovery doesn't depend on the journal size. A record
+    older than max_age seconds (by the monitor's clock) is not resumed from: the battery
+    and the generator have moved on since then.
+    """
+
+    def __init__(self, path: str, sync_interval: float = 10, max_records: int = 1000, max_age: float = 3600):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.max_records = max_records
+        self.max_age = max_age
+
+        self._f = open(path, 'a', encoding='utf-8')
+        self._terminate_torn_line()
+        self._records = 0
+        self._dirty = False
+        self._synced = time.monotonic()
+
+    def _terminate_torn_line(self):
+        # so that the next record isn't glued to a line torn by a crash
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                self._f.write('\n')
+                self._f.flush()
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                tail = b''
+                pos = size
+                while pos > 0:
+                    step = min(4096, pos)
+                    pos -= step
+                    f.seek(pos)
+                    tail = f.read(step) + tail
+                    # the last line may be torn if we crashed while writing it,
+                    # so look for the last complete one
+                    lines = tail.split(b'\n')
+                    for line in reversed(lines[1:-1] if pos > 0 else lines[:-1]):
+                        try:
+                            return json.loads(line)
+                        except ValueError:
+                            continue
+        except FileNotFoundError:
+            pass
+        return None
+
+    def append(self, state: dict):
+        self._f.write(json.dumps(state, separators=(',', ':')) + '\n')
+        self._f.flush()
+        self._dirty = True
+        self._records += 1
+
+        if self._records >= self.max_records:
+            self.compact(state)
+        else:
+            self.sync_if_due()
+
+    def sync_if_due(self):
+        if self._dirty and time.monotonic() - self._synced >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self._f.fileno())
+        self._dirty = False
+        self._synced = time.monotonic()
+
+    def compact(self, state: dict):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(state, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+        self._f.close()
+        self._f = open(self.path, 'a', encoding='utf-8')
+        self._records = 1
+        self._dirty = False
+        self._synced = time.monotonic()
+        logger.debug('journal compacted')
+
+    def close(self):
+        if self._dirty:
+            self.sync()
+        self._f.close()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 
@@ -5,6 +6,7 @@ from .types import *
 from threading import Thread
 from typing import Callable, Optional
 from .inverter_wrapper import wrapper_instance as inverter
+from .poller import poller_instance as poller
 from inverterd import InverterError
 from ..util import Stopwatch, StopwatchError
 from ..config import config
@@ -34,9 +36,6 @@ cfg = MonitorConfig()
 """
 TODO:
 - поддержать возможность ручного (через бота) переключения тока заряда вверх и вниз
-- поддержать возможность бесшовного перезапуска бота, когда монитор понимает, что зарядка уже идет, и он
-  не запускает программу с начала, а продолжает с уже существующей позиции. Уведомления при этом можно не
-  присылать совсем, либо прислать какое-то одно приложение, в духе "программа была перезапущена"
 """
 
 
@@ -48,10 +47,15 @@ class InverterMonitor(Thread):
     osp_change_cb: Optional[Callable]
     osp: Optional[OutputSourcePriority]
 
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float] = time.time, client=None):
         super().__init__()
         self.setName('InverterMonitor')
 
+        # Both can be replaced to run the charging program against an emulated
+        # inverter in virtual time, see test/test_inverter_monitor_sim.py.
+        self.clock = clock
+        self.client = client if client is not None else inverter
+
         self.interrupted = False
         self.min_allowed_current = 0
         self.ac_mode = None
@@ -84,13 +88,19 @@ class InverterMonitor(Thread):
 
         # The stopwatch is used to measure how long does the battery voltage exceeds the float voltage level.
         # We don't want to damage our batteries, right?
-        self.floating_stopwatch = Stopwatch()
+        self.floating_stopwatch = Stopwatch(clock=clock)
 
         # State variables for utilities charging program
         self.util_ac_present = None
         self.util_pd = None
         self.util_solar = None
 
+        # If set, the state above is saved on every change and restored on start,
+        # so that a restarted bot continues the program where it was.
+        self.journal = None
+        self._journaled_state = None
+        self._journaled_time = 0
+
     @property
     def active_current(self) -> Optional[int]:
         try:
@@ -101,8 +111,71 @@ class InverterMonitor(Thread):
             return None
 
     def run(self):
+        current = self._setup(self.client.exec('get-allowed-ac-charge-currents')['data'],
+                              poller.get_rated())
+        if current is not None:
+            self.client.exec('set-max-ac-charge-current', (0, current))
+
+        # Run implemented programs on every status polled by the poller (every 2 seconds).
+        last_time = 0
+        while not self.interrupted:
+            try:
+                snapshot = poller.wait_status(newer_than=last_time, timeout=10)
+                if snapshot is None:
+                    logger.error('no fresh status from the poller')
+                else:
+                    last_time = snapshot.time
+                    self.process_status(snapshot.data)
+
+            except InverterError as e:
+                logger.exception(e)
+
+        if self.journal is not None:
+            self.journal.close()
+
+    async def run_task(self, client, interval: float = 2):
+        """
+        Alternative to run() for asyncio programs: polls get-status with the
+        given AsyncInverterClient on a fixed schedule (not drifting by the time
+        a poll takes). Programs are run on the default executor, as they block.
+        """
+        loop = asyncio.get_running_loop()
+        status_future = None
+        try:
+            allowed_currents, rated = [r['data'] for r in await client.exec_many([('get-allowed-ac-charge-currents', ()),
+                                                                                   ('get-rated', ())])]
+            current = self._setup(allowed_currents, rated)
+            if current is not None:
+                await client.exec('set-max-ac-charge-current', (0, current))
+
+            next_time = loop.time()
+            while not self.interrupted:
+                try:
+                    response = await client.exec('get-status')
+                    # shielded, so that a cancelled task doesn't leave it running on its own
+                    status_future = loop.run_in_executor(None, self.process_status, response['data'])
+                    await asyncio.shield(status_future)
+                except (InverterError, ConnectionError, asyncio.TimeoutError) as e:
+                    logger.error(f'get-status failed: {str(e)}')
+
+                next_time += interval
+                now = loop.time()
+                if next_time < now:
+                    # skip missed ticks
+                    next_time = now
+                await asyncio.sleep(next_time - now)
+
+        finally:
+            if status_future is not None and not status_future.done():
+                await asyncio.wait([status_future])
+            if self.journal is not None:
+                self.journal.close()
+
+    def _setup(self, allowed_currents: list, rated: dict) -> Optional[int]:
+        # Returns the current to put back on the inverter, if the program was
+        # resumed from the journal: it may have been reset to the initial one.
         # Check allowed currents and validate the config.
-        allowed_currents = list(inverter.exec('get-allowed-ac-charge-currents')['data'])
+        allowed_currents = list(allowed_currents)
         allowed_currents.sort()
 
         for a in self.currents:
@@ -112,45 +185,74 @@ class InverterMonitor(Thread):
         self.min_allowed_current = min(allowed_currents)
 
         # Reading rated configuration
-        rated = inverter.exec('get-rated')['data']
         self.osp = OutputSourcePriority.from_text(rated['output_source_priority'])
 
-        # Read data and run implemented programs every 2 seconds.
-        while not self.interrupted:
-            try:
-                response = inverter.exec('get-status')
-                if response['result'] != 'ok':
-                    logger.error('get-status failed:', response)
-                else:
-                    gs = response['data']
-
-                    ac = gs['grid_voltage']['value'] > 0 or gs['grid_freq']['value'] > 0
-                    solar = gs['pv1_input_voltage']['value'] > 0 or gs['pv2_input_voltage']['value'] > 0
-                    solar_input = gs['pv1_input_power']['value']
-                    v = float(gs['battery_voltage']['value'])
-                    load_watts = int(gs['ac_output_active_power']['value'])
-                    pd = _pd_from_string(gs['battery_power_direction'])
-
-                    logger.debug(f'got status: ac={ac}, solar={solar}, v={v}, pd={pd}')
-
-                    if self.ac_mode == ACMode.GENERATOR:
-                        self.gen_charging_program(ac, solar, v, pd)
-
-                    elif self.ac_mode == ACMode.UTILITIES:
-                        self.utilities_monitoring_program(ac, solar, v, load_watts, solar_input, pd)
-
-                    if not ac or pd != BatteryPowerDirection.CHARGING:
-                        # if AC is disconnected or not charging, run the low voltage checking program
-                        self.low_voltage_program(v, load_watts)
-
-                    elif self.battery_state != BatteryState.NORMAL:
-                        # AC is connected and the battery is charging, assume battery level is normal
-                        self.battery_state = BatteryState.NORMAL
-
-            except InverterError as e:
-                logger.exception(e)
-
-            time.sleep(2)
+        if self.journal is not None and self._restore():
+            return self.active_current
+        return None
+
+    def _restore(self) -> bool:
+        started = time.monotonic()
+        state = self.journal.load()
+        if state is None:
+            return False
+
+        saved_time = state.pop('time', 0)
+        age = self.clock() - saved_time
+        if age > self.journal.max_age:
+            logger.info(f'journal: saved state is {int(age)} s old, starting over')
+            return False
+
+        if state['ac_mode'] != (self.ac_mode.value if self.ac_mode else None) or state['currents'] != self.currents:
+            logger.info('journal: saved state is for another AC mode or currents, starting over')
+            return False
+
+        self.restore_state(state)
+        self._journaled_state = state
+        self._journaled_time = saved_time
+
+        logger.info(f'journal: resumed in {self.charging_state.name} state, active current {self.active_current} A'
+                    f' ({(time.monotonic() - started) * 1000:.1f} ms)')
+        return True
+
+    def process_status(self, gs: dict):
+        ac = gs['grid_voltage']['value'] > 0 or gs['grid_freq']['value'] > 0
+        solar = gs['pv1_input_voltage']['value'] > 0 or gs['pv2_input_voltage']['value'] > 0
+        solar_input = gs['pv1_input_power']['value']
+        v = float(gs['battery_voltage']['value'])
+        load_watts = int(gs['ac_output_active_power']['value'])
+        pd = _pd_from_string(gs['battery_power_direction'])
+
+        logger.debug(f'got status: ac={ac}, solar={solar}, v={v}, pd={pd}')
+
+        if self.ac_mode == ACMode.GENERATOR:
+            self.gen_charging_program(ac, solar, v, pd)
+
+        elif self.ac_mode == ACMode.UTILITIES:
+            self.utilities_monitoring_program(ac, solar, v, load_watts, solar_input, pd)
+
+        if not ac or pd != BatteryPowerDirection.CHARGING:
+            # if AC is disconnected or not charging, run the low voltage checking program
+            self.low_voltage_program(v, load_watts)
+
+        elif self.battery_state != BatteryState.NORMAL:
+            # AC is connected and the battery is charging, assume battery level is normal
+            self.battery_state = BatteryState.NORMAL
+
+        if self.journal is not None:
+            self._journal_state()
+
+    def _journal_state(self):
+        state = self.dump_state()
+        now = self.clock()
+        # Written again from time to time even if nothing has changed, so that
+        # the time of the last record tells when the bot was last running.
+        if state != self._journaled_state or now - self._journaled_time >= self.journal.max_age / 2:
+            self.journal.append({**state, 'time': now})
+            self._journaled_state = state
+            self._journaled_time = now
+        else:
+            self.journal.sync_if_due()
 
     def utilities_monitoring_program(self,
                                      ac: bool,                  # whether AC is connected
@@ -300,10 +402,10 @@ class InverterMonitor(Thread):
                         self.gen_next_current(current=self.min_allowed_current)
 
                     elif self.next_current_enter_time == 0 and pd == BatteryPowerDirection.CHARGING:
-                        self.next_current_enter_time = time.time() + cfg.gen_raise_intervals[self.active_current_idx]
+                        self.next_current_enter_time = self.clock() + cfg.gen_raise_intervals[self.active_current_idx]
                         logger.info(f'gen_charging_program (warming path): set next_current_enter_time to {self.next_current_enter_time}')
 
-                    elif self.next_current_enter_time != 0 and time.time() >= self.next_current_enter_time:
+                    elif self.next_current_enter_time != 0 and self.clock() >= self.next_current_enter_time:
                         logger.info('gen_charging_program (warming path): hit next_current_enter_time, calling gen_next_current()')
                         self.gen_next_current()
                 else:
@@ -413,7 +515,7 @@ class InverterMonitor(Thread):
 
     def set_hw_charging_current(self, current: int):
         try:
-            response = inverter.exec('set-max-ac-charge-current', (0, current))
+            response = self.client.exec('set-max-ac-charge-current', (0, current))
             if response['result'] != 'ok':
                 logger.error(f'failed to change AC charging current to {current} A')
                 raise InverterError('set-max-ac-charge-current: inverterd reported error')
@@ -469,6 +571,9 @@ class InverterMonitor(Thread):
     def set_osp_need_change_callback(self, cb: Callable):
         self.osp_change_cb = cb
 
+    def set_journal(self, journal):
+        self.journal = journal
+
     def set_ac_mode(self, mode: ACMode):
         self.ac_mode = mode
 
@@ -478,6 +583,37 @@ class InverterMonitor(Thread):
     def stop(self):
         self.interrupted = True
 
+    def dump_state(self) -> dict:
+        # everything the programs need to continue, JSON-serializable
+        return {
+            'ac_mode': self.ac_mode.value if self.ac_mode else None,
+            'currents': self.currents,
+            'active_current_idx': self.active_current_idx,
+            'current_change_direction': self.current_change_direction.name,
+            'next_current_enter_time': self.next_current_enter_time,
+            'battery_state': self.battery_state.name,
+            'charging_state': self.charging_state.name,
+            'mostly_charged': self.mostly_charged,
+            'floating_stopwatch': [self.floating_stopwatch.elapsed, self.floating_stopwatch.time_started],
+            'util_ac_present': self.util_ac_present,
+            'util_pd': self.util_pd.name if self.util_pd else None,
+            'util_solar': self.util_solar,
+        }
+
+    def restore_state(self, state: dict):
+        self.active_current_idx = state['active_current_idx']
+        self.current_change_direction = CurrentChangeDirection[state['current_change_direction']]
+        self.next_current_enter_time = state['next_current_enter_time']
+        self.battery_state = BatteryState[state['battery_state']]
+        self.charging_state = ChargingState[state['charging_state']]
+        self.mostly_charged = state['mostly_charged']
+        # If the stopwatch was running, the time the bot was down is counted too.
+        # That's on the safe side for the batteries.
+        self.floating_stopwatch.elapsed, self.floating_stopwatch.time_started = state['floating_stopwatch']
+        self.util_ac_present = state['util_ac_present']
+        self.util_pd = BatteryPowerDirection[state['util_pd']] if state['util_pd'] else None
+        self.util_solar = state['util_solar']
+
     def dump_status(self) -> dict:
         return {
             'interrupted': self.interrupted,
@@ -489,7 +625,7 @@ class InverterMonitor(Thread):
             'mostly_charged': self.mostly_charged,
             'floating_stopwatch_paused': self.floating_stopwatch.is_paused(),
             'floating_stopwatch_elapsed': self.floating_stopwatch.get_elapsed_time(),
-            'time_now': time.time(),
+            'time_now': self.clock(),
             'next_current_enter_time': self.next_current_enter_time,
             'ac_mode': self.ac_mode,
             'osp': self.osp,
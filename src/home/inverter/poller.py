@@ -0,0 +1,123 @@
+import logging
+import time
+
+from threading import Thread, Condition
+from typing import Optional
+from inverterd import InverterError
+from .inverter_wrapper import wrapper_instance as inverter
+
+logger = logging.getLogger(__name__)
+
+
+class InverterSnapshot:
+    data: dict
+    time: float
+
+    def __init__(self, data: dict, time: float):
+        self.data = data
+        self.time = time
+
+    def age(self) -> float:
+        return time.monotonic() - self.time
+
+
+class InverterPoller(Thread):
+    """
+    The only thread that polls get-status (and, less often, get-rated). Others
+    read the latest snapshots instead of queuing for the inverter themselves.
+    """
+
+    status_interval: float
+    rated_interval: float
+
+    def __init__(self):
+        super().__init__()
+        self.setName('InverterPoller')
+        self.daemon = True
+
+        self.status_interval = 2
+        self.rated_interval = 300
+
+        self.interrupted = False
+        self._cond = Condition()
+        self._status: Optional[InverterSnapshot] = None
+        self._rated: Optional[InverterSnapshot] = None
+        self._rated_settings_version = None
+
+    def configure(self, status_interval: float, rated_interval: float):
+        self.status_interval = status_interval
+        self.rated_interval = rated_interval
+
+    def run(self):
+        while not self.interrupted:
+            started = time.monotonic()
+            try:
+                self._poll_status()
+                if self._rated_is_stale():
+                    self._poll_rated()
+            except InverterError as e:
+                logger.exception(e)
+            except Exception as e:
+                # connection errors, the wrapper reconnects by itself
+                logger.error(f'poll failed: {str(e)}')
+
+            time.sleep(max(0., self.status_interval - (time.monotonic() - started)))
+
+    def stop(self):
+        self.interrupted = True
+
+    def get_status(self, max_age: Optional[float] = None) -> dict:
+        """
+        Returns get-status data at most max_age seconds old (by default, up to
+        two polling intervals). If the poller lags behind, the inverter is
+        queried directly.
+        """
+        if max_age is None:
+            max_age = self.status_interval * 2
+        snapshot = self._status
+        if snapshot is None or snapshot.age() > max_age:
+            snapshot = self._poll_status()
+        return snapshot.data
+
+    def get_rated(self) -> dict:
+        if self._rated_is_stale():
+            return self._poll_rated().data
+        return self._rated.data
+
+    def wait_status(self, newer_than: float, timeout: float) -> Optional[InverterSnapshot]:
+        """Waits for a snapshot taken after newer_than (as returned by a previous call)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._status is not None and self._status.time > newer_than,
+                                timeout=timeout)
+            if self._status is not None and self._status.time > newer_than:
+                return self._status
+            return None
+
+    def _rated_is_stale(self) -> bool:
+        return self._rated is None \
+            or self._rated.age() > self.rated_interval \
+            or self._rated_settings_version != inverter.settings_version
+
+    def _poll_status(self) -> InverterSnapshot:
+        response = inverter.exec('get-status')
+        if response['result'] != 'ok':
+            raise InverterError(f'get-status failed: {response}')
+
+        snapshot = InverterSnapshot(response['data'], time.monotonic())
+        with self._cond:
+            self._status = snapshot
+            self._cond.notify_all()
+        return snapshot
+
+    def _poll_rated(self) -> InverterSnapshot:
+        version = inverter.settings_version
+        response = inverter.exec('get-rated')
+        if response['result'] != 'ok':
+            raise InverterError(f'get-rated failed: {response}')
+
+        self._rated = InverterSnapshot(response['data'], time.monotonic())
+        self._rated_settings_version = version
+        return self._rated
+
+
+poller_instance = InverterPoller()
@@ -0,0 +1,149 @@
+import bisect
+import struct
+
+from typing import Iterator, Optional
+from ..mqtt.payload.inverter import Status, StatusBatch
+from .emulator import (
+    MPPTChargerStatus,
+    BatteryPowerDirection,
+    DC_AC_PowerDirection,
+    LinePowerDirection,
+    LoadConnectionStatus,
+)
+
+# File structure:
+#
+# char[4] magic;
+# uint8_t version;
+# struct {
+#     uint32_t size;
+#     uint8_t[size] batch;  // StatusBatch, delta-encoded and compressed
+# } chunks[];
+#
+# Chunks are written as they fill up, so a recording that was interrupted
+# loses the last chunk at most.
+
+Magic = b'INVR'
+Version = 1
+ChunkHeader = '=I'
+
+_enums = {
+    'mppt1_charger_status': MPPTChargerStatus,
+    'mppt2_charger_status': MPPTChargerStatus,
+    'battery_power_direction': BatteryPowerDirection,
+    'dc_ac_power_direction': DC_AC_PowerDirection,
+    'line_power_direction': LinePowerDirection,
+    'load_connected': LoadConnectionStatus,
+}
+
+
+def status_from_simple_json(data: dict, time: float) -> Status:
+    """Builds a Status from get-status data in the SIMPLE_JSON format."""
+    kwargs = {'time': round(time)}
+    for field, field_type in Status.__annotations__.items():
+        if field == 'time':
+            continue
+        kwargs[field] = float(data[field]) if field_type is float else int(data[field])
+    return Status(**kwargs)
+
+
+class StatusRecorder:
+    def __init__(self, path: str, chunk_size: int = 300):
+        self.chunk_size = chunk_size
+        self._statuses = []
+        self._f = open(path, 'ab')
+        if self._f.tell() == 0:
+            self._f.write(Magic + struct.pack('=B', Version))
+            self._f.flush()
+
+    def add(self, status: Status):
+        self._statuses.append(status)
+        if len(self._statuses) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._statuses:
+            return
+        batch = StatusBatch(statuses=self._statuses, delta=True, compress=True).pack()
+        self._f.write(struct.pack(ChunkHeader, len(batch)) + batch)
+        self._f.flush()
+        self._statuses = []
+
+    def close(self):
+        self.flush()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_recording(path: str) -> Iterator[Status]:
+    header_size = struct.calcsize(ChunkHeader)
+    with open(path, 'rb') as f:
+        header = f.read(len(Magic) + 1)
+        if header[:len(Magic)] != Magic:
+            raise ValueError(f'{path}: not an inverter recording')
+        if header[len(Magic)] != Version:
+            raise ValueError(f'{path}: unsupported version {header[len(Magic)]}')
+
+        while True:
+            buf = f.read(header_size)
+            if len(buf) < header_size:
+                break
+            size, = struct.unpack(ChunkHeader, buf)
+            buf = f.read(size)
+            if len(buf) < size:
+                # truncated by an interrupted recording
+                break
+            yield from StatusBatch.unpack(buf).statuses
+
+
+class RecordingModel:
+    """
+    Emulator model (see InverterEmulator) that plays a recording back: the
+    status is the recorded one at the same offset from the start, in the
+    emulator's clock, so a ScaledClock or a VirtualClock sets the speed.
+    Commands don't affect it. After the end, the last status stays.
+    """
+
+    def __init__(self, path: str):
+        self.statuses = list(read_recording(path))
+        if not self.statuses:
+            raise ValueError(f'{path}: recording is empty')
+        self.times = [s.time for s in self.statuses]
+        self.offset: Optional[float] = None
+        self.now = None
+
+        # set by the emulator, but meaningless here
+        self.ac_charge_current = None
+        self.recharge_v = None
+
+    @property
+    def duration(self) -> int:
+        return self.times[-1] - self.times[0]
+
+    def advance_to(self, now: float):
+        if self.offset is None:
+            self.offset = now - self.times[0]
+        self.now = now
+
+    def current(self) -> Status:
+        idx = bisect.bisect_right(self.times, self.now - self.offset) - 1
+        return self.statuses[max(idx, 0)]
+
+    def update_rated(self, rated: dict):
+        pass
+
+    def update_status(self, status: dict):
+        s = self.current()
+        for field in Status.__annotations__:
+            if field == 'time':
+                continue
+            value = getattr(s, field)
+            if field in _enums:
+                status[field] = _enums[field](value)
+            else:
+                status[field]['value'] = value
@@ -0,0 +1,221 @@
+import time
+import toml
+
+from typing import Optional
+from .emulator import (
+    BatteryPowerDirection,
+    LinePowerDirection,
+    MPPTChargerStatus,
+)
+
+
+class VirtualClock:
+    """
+    Clock for running the charging program in virtual time. Pass its time()
+    wherever time.time would be used; it only moves when advance() is called.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.now = start if start is not None else time.time()
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class ScaledClock:
+    """Real-time clock running speed times faster, for the emulator server."""
+
+    def __init__(self, speed: float = 1):
+        self.speed = speed
+        self._started = time.time()
+        self._started_monotonic = time.monotonic()
+
+    def time(self) -> float:
+        return self._started + (time.monotonic() - self._started_monotonic) * self.speed
+
+
+class BatteryModel:
+    """
+    Simple physics of a 48 V lead-acid bank behind the inverter.
+
+    The open-circuit voltage is linear in the state of charge, and the voltage
+    under charge grows with the current and, steeply, with the state of charge,
+    so that the voltage limits of the charging program are hit roughly where
+    they are with real batteries. The inverter's AC charger starts (after a
+    short delay) when the battery voltage drops below the recharge threshold,
+    charges with max_ac_charge_current amps, never exceeds the bulk voltage,
+    and pauses while the MPPT is active. A generator, if its power is set,
+    stalls when charging plus load exceed it.
+    """
+
+    ocv_empty = 47.2
+    ocv_full = 50.9
+    internal_resistance = 0.05
+    absorption_resistance = 0.6
+    charger_delay = 10
+
+    def __init__(self,
+                 capacity: float = 200,     # Ah
+                 soc: float = .5,           # 0..1
+                 load: float = 150,         # W
+                 solar: float = 0,          # W
+                 ac: bool = False,
+                 generator_power: Optional[float] = None,  # W, None for utilities
+                 recharge_v: float = 51,
+                 bulk_v: float = 57.6,
+                 ac_charge_current: int = 2):
+        self.capacity = capacity
+        self.soc = soc
+        self.load = load
+        self.solar = solar
+        self.generator_power = generator_power
+        self.recharge_v = recharge_v
+        self.bulk_v = bulk_v
+        self.ac_charge_current = ac_charge_current
+
+        self.ac = ac
+        self.ac_since = None
+        self.charging = False
+        self.current = 0.       # battery current, positive when charging
+        self.voltage = self.ocv()
+        self.time = None
+
+    def ocv(self) -> float:
+        return self.ocv_empty + (self.ocv_full - self.ocv_empty) * self.soc
+
+    def resistance(self) -> float:
+        return self.internal_resistance + self.absorption_resistance * self.soc ** 6
+
+    def set_ac(self, ac: bool, now: float):
+        if ac and not self.ac:
+            self.ac_since = now
+        elif not ac:
+            self.ac_since = None
+            self.charging = False
+        self.ac = ac
+
+    def advance_to(self, now: float):
+        if self.time is None:
+            self.time = now
+            if self.ac:
+                self.ac_since = now
+        if now > self.time:
+            self.step(now, now - self.time)
+        self.time = now
+
+    def step(self, now: float, dt: float):
+        mppt = self.solar > 0
+
+        if self.ac and not mppt:
+            if not self.charging \
+                    and now - self.ac_since >= self.charger_delay \
+                    and self.voltage < self.recharge_v \
+                    and self.soc < 1:
+                self.charging = True
+        else:
+            self.charging = False
+
+        if self.charging:
+            # constant current, then constant voltage at the bulk level
+            current = min(float(self.ac_charge_current), (self.bulk_v - self.ocv()) / self.resistance())
+            if self.generator_power is not None \
+                    and current * self.voltage + self.load > self.generator_power:
+                self.set_ac(False, now)
+                current = -self.load / self.voltage
+        elif self.ac and not mppt:
+            # load is fed from the line
+            current = 0.
+        else:
+            current = (self.solar - self.load) / self.voltage
+
+        self.soc = min(1., max(0., self.soc + current * dt / 3600 / self.capacity))
+        if self.soc >= 1 and current > 0:
+            self.charging = False
+            current = 0.
+
+        self.current = current
+        self.voltage = self.ocv() + current * self.resistance()
+
+    def power_direction(self) -> BatteryPowerDirection:
+        if self.current > .5:
+            return BatteryPowerDirection.Charge
+        elif self.current < -.5:
+            return BatteryPowerDirection.Discharge
+        return BatteryPowerDirection.DoNothing
+
+    def update_rated(self, rated: dict):
+        rated['battery_recharge_voltage']['value'] = self.recharge_v
+        rated['battery_bulk_voltage']['value'] = self.bulk_v
+        rated['max_ac_charge_current']['value'] = self.ac_charge_current
+
+    def update_status(self, status: dict):
+        """Writes the model state into the emulator's get-status dict."""
+        status['grid_voltage']['value'] = 230.0 if self.ac else 0.0
+        status['grid_freq']['value'] = 50.0 if self.ac else 0.0
+        status['ac_output_active_power']['value'] = int(self.load)
+        status['ac_output_apparent_power']['value'] = int(self.load * 1.2)
+        status['battery_voltage']['value'] = round(self.voltage, 1)
+        status['battery_charge_current']['value'] = int(max(0., self.current))
+        status['battery_discharge_current']['value'] = int(max(0., -self.current))
+        status['battery_capacity']['value'] = int(self.soc * 100)
+        status['pv1_input_power']['value'] = int(self.solar)
+        status['pv1_input_voltage']['value'] = 120.0 if self.solar > 0 else 0.0
+        status['mppt1_charger_status'] = MPPTChargerStatus.Charging if self.solar > 0 else MPPTChargerStatus.Abnormal
+        status['battery_power_direction'] = self.power_direction()
+        status['line_power_direction'] = LinePowerDirection.Input if self.ac else LinePowerDirection.DoNothing
+
+
+class Scenario:
+    """
+    Scenario file, in TOML:
+
+        duration = 28800        # virtual seconds
+        ac_mode = 'generator'   # or 'utilities'
+        interval = 2            # how often the monitor gets status
+        [battery]               # BatteryModel arguments
+        soc = 0.4
+        generator_power = 2500
+        [monitor]               # overrides of the [monitor] config section
+        gen_floating_time_max = 3600
+        [[events]]              # changes of the environment at virtual times
+        at = 60
+        ac = true               # also: solar (W), load (W), soc
+        [expect]
+        events = ['AC_NOT_CHARGING', ...]
+    """
+
+    def __init__(self, data: dict, path: Optional[str] = None):
+        self.path = path
+        self.description = data.get('description', '')
+        self.duration = data['duration']
+        self.ac_mode = data.get('ac_mode', 'generator')
+        self.interval = data.get('interval', 2)
+        self.battery = data.get('battery', {})
+        self.monitor = data.get('monitor', {})
+        self.events = sorted(data.get('events', []), key=lambda e: e['at'])
+        self.expected_events = data.get('expect', {}).get('events')
+
+    @classmethod
+    def load(cls, path: str) -> 'Scenario':
+        return cls(toml.load(path), path)
+
+    def create_model(self) -> BatteryModel:
+        return BatteryModel(**self.battery)
+
+    def apply(self, model: BatteryModel, started: float, now: float, pos: int) -> int:
+        """Applies events that are due by now, starting from pos. Returns the new pos."""
+        while pos < len(self.events) and started + self.events[pos]['at'] <= now:
+            event = self.events[pos]
+            if 'ac' in event:
+                model.set_ac(event['ac'], now)
+            if 'solar' in event:
+                model.solar = event['solar']
+            if 'load' in event:
+                model.load = event['load']
+            if 'soc' in event:
+                model.soc = event['soc']
+            pos += 1
+        return pos
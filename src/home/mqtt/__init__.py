@@ -1,3 +1,3 @@
 from .mqtt import MQTTBase
-from .util import poll_tick
-from .relay import MQTTRelay, MQTTRelayState, MQTTRelayDevice
\ No newline at end of file
+from .util import poll_tick, DeadbandFilter
+from .relay import MQTTRelay, MQTTAsyncRelay, MQTTRelayState, MQTTRelayDevice
\ No newline at end of file
@@ -0,0 +1,225 @@
+import asyncio
+import paho.mqtt.client as mqtt
+
+from typing import AsyncIterator
+from .mqtt import MQTTBase
+from ..config import config
+
+# Max number of received messages waiting for messages() consumers, the oldest
+# ones are dropped after that.
+MessageQueueSize = 1000
+
+
+class MQTTAsyncBase(MQTTBase):
+    """
+    MQTTBase variant that runs paho's network loop on an asyncio event loop
+    (for example, the aiohttp one) instead of a separate thread. All callbacks
+    are invoked on the event loop, so subclasses don't need any locking.
+    """
+
+    def __init__(self, clean_session=True):
+        super().__init__(clean_session=clean_session)
+
+        self._loop = None
+        self._misc_task = None
+        self._reconnect_task = None
+        self._disconnecting = False
+        self._connected = None
+
+        self._publish_futures = {}
+        self._published_mids = set()
+        self._publishing = False
+        self._subscribe_futures = {}
+        self._messages = asyncio.Queue(maxsize=MessageQueueSize)
+        self._consumers = 0
+
+        self._client.on_subscribe = self._on_subscribe
+        self._client.on_socket_open = self._on_socket_open
+        self._client.on_socket_close = self._on_socket_close
+        self._client.on_socket_register_write = self._on_socket_register_write
+        self._client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    async def connect(self):
+        self._loop = asyncio.get_running_loop()
+        self._connected = self._loop.create_future()
+        self._disconnecting = False
+
+        host = config['mqtt']['host']
+        port = config['mqtt']['port']
+
+        # connect() does blocking DNS resolution, TCP and TLS handshakes
+        await self._loop.run_in_executor(None, self._client.connect, host, port, 60)
+        await self._connected
+
+    async def disconnect(self):
+        self._disconnecting = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        self._client.disconnect()
+
+    async def publish(self, topic: str, payload=None, qos=0, retain=False) -> int:
+        """
+        Resolves when the message is acknowledged by the broker (PUBACK for QoS 1,
+        PUBCOMP for QoS 2), or when it's written to the socket for QoS 0. Raises
+        ConnectionError if there's no connection or it's lost before that; paho
+        still keeps QoS 1 and 2 messages and sends them after reconnecting.
+        """
+        future = self._loop.create_future()
+        self._publishing = True
+        try:
+            info = self._client.publish(topic, payload=payload, qos=qos, retain=retain)
+        finally:
+            self._publishing = False
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._published_mids.discard(info.mid)
+            raise ConnectionError(f'publish failed: {mqtt.error_string(info.rc)}')
+
+        # on_publish could have been already called from inside publish()
+        if info.mid in self._published_mids:
+            self._published_mids.remove(info.mid)
+            return info.mid
+
+        self._publish_futures[info.mid] = future
+        try:
+            await future
+        finally:
+            self._publish_futures.pop(info.mid, None)
+        return info.mid
+
+    async def subscribe(self, topic: str, qos=0):
+        future = self._loop.create_future()
+        rc, mid = self._client.subscribe(topic, qos=qos)
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f'subscribe failed: {mqtt.error_string(rc)}')
+
+        self._subscribe_futures[mid] = future
+        try:
+            return await future
+        finally:
+            self._subscribe_futures.pop(mid, None)
+
+    async def messages(self) -> AsyncIterator[mqtt.MQTTMessage]:
+        """
+        Yields received messages. They are queued only while some consumer is
+        iterating (so start it before subscribing), subclasses that handle
+        on_message() themselves pay nothing.
+        """
+        self._consumers += 1
+        try:
+            while True:
+                yield await self._messages.get()
+        finally:
+            self._consumers -= 1
+            if not self._consumers:
+                while not self._messages.empty():
+                    self._messages.get_nowait()
+
+    def on_connect(self, client: mqtt.Client, userdata, flags, rc):
+        super().on_connect(client, userdata, flags, rc)
+        if self._connected is not None and not self._connected.done():
+            if rc == 0:
+                self._connected.set_result(True)
+            else:
+                self._connected.set_exception(ConnectionError(mqtt.connack_string(rc)))
+
+    def on_disconnect(self, client: mqtt.Client, userdata, rc):
+        super().on_disconnect(client, userdata, rc)
+
+        # nothing that's waited for is going to come over this connection
+        error = ConnectionError(f'disconnected: {mqtt.error_string(rc)}')
+        for future in (*self._publish_futures.values(), *self._subscribe_futures.values()):
+            if not future.done():
+                future.set_exception(error)
+
+        if self._connected is not None and not self._connected.done():
+            # closed before CONNACK, connect() fails and it's up to the caller to retry
+            self._connected.set_exception(error)
+            return
+
+        if not self._disconnecting and self._reconnect_task is None:
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    def on_message(self, client: mqtt.Client, userdata, msg):
+        super().on_message(client, userdata, msg)
+        if not self._consumers:
+            return
+        if self._messages.full():
+            self._logger.warning('message queue is full, dropping the oldest message')
+            self._messages.get_nowait()
+        self._messages.put_nowait(msg)
+
+    def on_publish(self, client: mqtt.Client, userdata, mid):
+        super().on_publish(client, userdata, mid)
+        future = self._publish_futures.get(mid)
+        if future is None:
+            # remembered only if it's from the publish() call that is in progress, which
+            # will find it; mids of other messages would stay here after the counter wraps
+            if self._publishing:
+                self._published_mids.add(mid)
+        elif not future.done():
+            future.set_result(mid)
+
+    def _on_subscribe(self, client: mqtt.Client, userdata, mid, granted_qos):
+        future = self._subscribe_futures.get(mid)
+        if future is not None and not future.done():
+            future.set_result(granted_qos)
+
+    async def _reconnect(self):
+        delay = 1
+        try:
+            while not self._disconnecting:
+                await asyncio.sleep(delay)
+                try:
+                    await self._loop.run_in_executor(None, self._client.reconnect)
+                    return
+                except Exception as e:
+                    self._logger.warning(f'reconnect failed: {str(e)}')
+                    delay = min(delay * 2, 60)
+        finally:
+            self._reconnect_task = None
+
+    async def _misc_loop(self):
+        while self._client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+    # socket callbacks may be called from the executor thread (during connect),
+    # in that case the event loop is accessed through call_soon_threadsafe()
+
+    def _call_in_loop(self, f, *args):
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+
+        if in_loop:
+            f(*args)
+        else:
+            self._loop.call_soon_threadsafe(f, *args)
+
+    def _on_socket_open(self, client: mqtt.Client, userdata, sock):
+        self._call_in_loop(self._add_socket, client, sock)
+
+    def _on_socket_close(self, client: mqtt.Client, userdata, sock):
+        # the socket is closed right after this callback returns, but the loop finds
+        # it by the object, and from another thread it's the only safe way anyway
+        self._call_in_loop(self._remove_socket, sock)
+
+    def _on_socket_register_write(self, client: mqtt.Client, userdata, sock):
+        self._call_in_loop(self._loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata, sock):
+        self._call_in_loop(self._loop.remove_writer, sock)
+
+    def _add_socket(self, client: mqtt.Client, sock):
+        self._loop.add_reader(sock, client.loop_read)
+        self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _remove_socket(self, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
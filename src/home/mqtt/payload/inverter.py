@@ -1,7 +1,8 @@
 import struct
+import zlib
 
 from .base_payload import MQTTPayload, bit_field
-from typing import Tuple
+from typing import Tuple, List
 
 _mult_10 = lambda n: int(n*10)
 _div_10 = lambda n: n/10
@@ -71,3 +72,78 @@ class Generation(MQTTPayload):
 
     time: int
     wh: int
+
+
+class StatusBatch(MQTTPayload):
+    FORMAT = '=BH'
+
+    FLAG_DELTA = 0x1
+    FLAG_ZLIB = 0x2
+
+    statuses: List[Status]
+    delta: bool
+    compress: bool
+
+    # structure of returned data:
+    #
+    # uint8_t flags;
+    # uint16_t count;
+    # uint8_t[count][46] records;  // zlib-compressed, if FLAG_ZLIB is set
+    #
+    # When FLAG_DELTA is set, every record except the first one is XOR'ed with
+    # the previous packed record. Consecutive samples mostly differ in a few
+    # bytes, so the records become almost all zeroes and compress very well.
+
+    def pack(self):
+        flags = 0
+        if self.delta:
+            flags |= self.FLAG_DELTA
+        if self.compress:
+            flags |= self.FLAG_ZLIB
+
+        body = bytearray()
+        prev = None
+        for status in self.statuses:
+            record = status.pack()
+            if self.delta and prev is not None:
+                body.extend(_xor(record, prev))
+            else:
+                body.extend(record)
+            prev = record
+
+        if self.compress:
+            body = zlib.compress(bytes(body))
+
+        buf = bytearray(struct.pack(self.FORMAT, flags, len(self.statuses)))
+        buf.extend(body)
+        return bytes(buf)
+
+    @classmethod
+    def unpack(cls, buf: bytes):
+        header_size = struct.calcsize(cls.FORMAT)
+        flags, count = struct.unpack(cls.FORMAT, buf[:header_size])
+
+        body = buf[header_size:]
+        if flags & cls.FLAG_ZLIB:
+            body = zlib.decompress(body)
+
+        record_size = struct.calcsize(Status.FORMAT)
+        if len(body) != record_size * count:
+            raise ValueError(f'{cls.__name__}.unpack: expected {record_size * count} bytes, got {len(body)}')
+
+        statuses = []
+        prev = None
+        for i in range(count):
+            record = body[i*record_size:(i+1)*record_size]
+            if flags & cls.FLAG_DELTA and prev is not None:
+                record = _xor(record, prev)
+            statuses.append(Status.unpack(record))
+            prev = record
+
+        return cls(statuses=statuses,
+                   delta=bool(flags & cls.FLAG_DELTA),
+                   compress=bool(flags & cls.FLAG_ZLIB))
+
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    return bytes(x ^ y for x, y in zip(a, b))
@@ -1,4 +1,5 @@
 import hashlib
+import struct
 
 from .base_payload import MQTTPayload, MQTTPayloadCustomField
 
@@ -94,3 +95,68 @@ class OTAPayload(MQTTPayload):
         # filename = buf[12:].decode()
         # return OTAPayload(secret=secret, filename=filename)
 
+
+
+# Chunked OTA protocol
+# --------------------
+#
+# 1. admin/ota/begin (OTABeginPayload) starts a new update, or resumes the running
+#    one if its size matches. The device replies with OTAAckPayload carrying the
+#    number of bytes already written.
+# 2. admin/ota/chunk (OTAChunkPayload) carries data at the given offset. Chunks
+#    at unexpected offsets are not written; every chunk is acked with the current
+#    number of written bytes, so the sender always knows where to continue from.
+# 3. admin/ota/end (OTAEndPayload) carries MD5 of the whole image. The device
+#    verifies it, finishes the update and replies with OTAResultPayload.
+
+class OTABeginPayload(MQTTPayload):
+    FORMAT = '=12sI16s'
+    PACKER = {
+        'secret': lambda s: s.encode('utf-8')
+    }
+
+    secret: str
+    size: int
+    md5: bytes
+
+
+class OTAChunkPayload(MQTTPayload):
+    FORMAT = '=12sI'
+
+    secret: str
+    offset: int
+    data: bytes
+
+    # structure of returned data:
+    #
+    # uint8_t[12] secret;
+    # uint32_t offset;
+    # *uint8_t data
+
+    def pack(self):
+        buf = bytearray(struct.pack(self.FORMAT, self.secret.encode('utf-8'), self.offset))
+        buf.extend(self.data)
+        return bytes(buf)
+
+    @classmethod
+    def unpack(cls, buf: bytes):
+        header_size = struct.calcsize(cls.FORMAT)
+        secret, offset = struct.unpack(cls.FORMAT, buf[:header_size])
+        return cls(secret=secret.decode('utf-8'), offset=offset, data=buf[header_size:])
+
+
+class OTAEndPayload(MQTTPayload):
+    FORMAT = '=12s16s'
+    PACKER = {
+        'secret': lambda s: s.encode('utf-8')
+    }
+
+    secret: str
+    md5: bytes
+
+
+class OTAAckPayload(MQTTPayload):
+    FORMAT = '=BI'
+
+    result: int
+    offset: int
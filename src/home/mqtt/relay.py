@@ -1,18 +1,43 @@
 import paho.mqtt.client as mqtt
+import asyncio
+import hashlib
+import os.path
 import re
 import datetime
 
 from .mqtt import MQTTBase
-from typing import Optional, Union
+from .aio import MQTTAsyncBase
+from typing import Optional, Union, Tuple, AsyncIterator
+from .payload import MQTTPayload
 from .payload.relay import (
     InitialStatPayload,
     StatPayload,
     PowerPayload,
     OTAPayload,
-    OTAResultPayload
+    OTAResultPayload,
+    OTABeginPayload,
+    OTAChunkPayload,
+    OTAEndPayload,
+    OTAAckPayload
 )
 
 
+# Time for a device with an old firmware to receive the whole image in one message,
+# write and check it.
+LegacyOTATimeout = 120
+
+
+def _file_md5(filename: str) -> bytes:
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as fd:
+        while True:
+            data = fd.read(65536)
+            if not data:
+                break
+            md5.update(data)
+    return md5.digest()
+
+
 class MQTTRelayDevice:
     id: str
     secret: Optional[str]
@@ -57,29 +82,12 @@ class MQTTRelay(MQTTBase):
 
     def on_message(self, client: mqtt.Client, userdata, msg):
         try:
-            match = re.match(r'^hk/(.*?)/relay/(stat|stat1|power|otares)$', msg.topic)
             self._logger.debug(f'topic: {msg.topic}')
-            if not match:
-                return
-
-            device_id = match.group(1)
-            subtopic = match.group(2)
-
-            try:
-                next(d for d in self._devices if d.id == device_id)
-            except StopIteration:
+            result = _unpack_message(msg, self._devices)
+            if result is None:
                 return
 
-            message = None
-            if subtopic == 'stat':
-                message = StatPayload.unpack(msg.payload)
-            elif subtopic == 'stat1':
-                message = InitialStatPayload.unpack(msg.payload)
-            elif subtopic == 'power':
-                message = PowerPayload.unpack(msg.payload)
-            elif subtopic == 'otares':
-                message = OTAResultPayload.unpack(msg.payload)
-
+            device_id, message = result
             if message and self._message_callback:
                 self._message_callback(device_id, message)
 
@@ -116,6 +124,224 @@ class MQTTRelay(MQTTBase):
         self._client.loop_write()
 
 
+class MQTTAsyncRelay(MQTTAsyncBase):
+    """
+    Asyncio counterpart of MQTTRelay. Keeps a cache of the last known device states,
+    allows to wait for the device to confirm a power change and to subscribe to
+    state changes.
+    """
+
+    _devices: list[MQTTRelayDevice]
+    _states: dict[str, 'MQTTRelayState']
+
+    def __init__(self, devices: Union[MQTTRelayDevice, list[MQTTRelayDevice]]):
+        super().__init__(clean_session=True)
+        if not isinstance(devices, list):
+            devices = [devices]
+        self._devices = devices
+        self._states = {}
+        self._state_waiters = []
+        self._watchers = []
+        self._ota_queues = {}
+
+    def on_connect(self, client: mqtt.Client, userdata, flags, rc):
+        super().on_connect(client, userdata, flags, rc)
+        for device in self._devices:
+            topic = f'hk/{device.id}/relay/#'
+            self._logger.debug(f"subscribing to {topic}")
+            client.subscribe(topic, qos=1)
+
+    def on_message(self, client: mqtt.Client, userdata, msg):
+        try:
+            result = _unpack_message(msg, self._devices)
+            if result is None:
+                return
+
+            device_id, message = result
+            if isinstance(message, (OTAAckPayload, OTAResultPayload)):
+                if device_id in self._ota_queues:
+                    self._ota_queues[device_id].put_nowait(message)
+                return
+
+            if not isinstance(message, (InitialStatPayload, StatPayload)):
+                return
+
+            if device_id not in self._states:
+                self._states[device_id] = MQTTRelayState()
+            state = self._states[device_id]
+            changed = not state.ever_updated or state.enabled != message.flags.state
+            state.update(enabled=message.flags.state,
+                         rssi=message.rssi,
+                         fw_version=message.fw_version if isinstance(message, InitialStatPayload) else None)
+
+            for waiter in self._state_waiters:
+                waiter_device_id, expected, future = waiter
+                if waiter_device_id == device_id and expected == state.enabled and not future.done():
+                    future.set_result(state)
+
+            if changed:
+                for queue in self._watchers:
+                    queue.put_nowait((device_id, state))
+
+        except Exception as e:
+            self._logger.exception(str(e))
+
+    def get_state(self, device_id: str) -> Optional['MQTTRelayState']:
+        return self._states.get(device_id)
+
+    def get_states(self) -> dict[str, 'MQTTRelayState']:
+        return self._states
+
+    async def set_power(self, device_id, enable: bool, secret=None):
+        device = next(d for d in self._devices if d.id == device_id)
+        secret = secret if secret else device.secret
+
+        assert secret is not None, 'device secret not specified'
+
+        payload = PowerPayload(secret=secret,
+                               state=enable)
+        await self.publish(f'hk/{device.id}/relay/power',
+                           payload=payload.pack(),
+                           qos=1)
+
+    async def set_power_and_confirm(self, device_id, enable: bool, secret=None, timeout=5) -> 'MQTTRelayState':
+        """
+        Publishes the power command and waits for the device to report the expected
+        state. Raises asyncio.TimeoutError if it hasn't been reported in time (the
+        timeout covers both the broker's acknowledgement and the report).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waiter = (device_id, enable, loop.create_future())
+        self._state_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(self.set_power(device_id, enable, secret), timeout)
+            return await asyncio.wait_for(waiter[2], max(0., deadline - loop.time()))
+        finally:
+            self._state_waiters.remove(waiter)
+
+    async def push_ota(self,
+                       device_id,
+                       filename: str,
+                       chunk_size=1024,
+                       timeout=10,
+                       retries=5,
+                       legacy_fallback=True,
+                       progress_callback: Optional[callable] = None) -> OTAResultPayload:
+        """
+        Uploads firmware using the chunked OTA protocol (see payload/relay.py).
+        Every chunk is acked by the device. If the device already has a partially
+        uploaded copy of the same image (same size and MD5), the upload is resumed
+        from where it stopped.
+
+        Firmwares older than the chunked protocol don't answer the begin message.
+        With legacy_fallback, the image is then sent in a single message instead.
+        """
+        device = next(d for d in self._devices if d.id == device_id)
+        assert device.secret is not None, 'device secret not specified'
+
+        size = os.path.getsize(filename)
+        topic = f'hk/{device.id}/relay/admin/ota'
+
+        loop = asyncio.get_running_loop()
+        md5 = await loop.run_in_executor(None, _file_md5, filename)
+
+        queue = asyncio.Queue()
+        self._ota_queues[device.id] = queue
+        try:
+            try:
+                # new firmwares answer right away, so a retry is not worth
+                # the wait when falling back is possible
+                ack = await self._ota_request(queue, f'{topic}/begin',
+                                              OTABeginPayload(secret=device.secret, size=size, md5=md5),
+                                              OTAAckPayload, timeout, 1 if legacy_fallback else retries)
+            except TimeoutError:
+                if not legacy_fallback:
+                    raise
+                self._logger.warning(f'{device.id}: no answer to OTA begin, sending the image in a single message')
+                return await self._ota_request(queue, topic,
+                                               OTAPayload(secret=device.secret, filename=filename),
+                                               OTAResultPayload, LegacyOTATimeout, 1)
+
+            self._check_ota_ack(device.id, ack)
+            if ack.offset:
+                self._logger.info(f'{device.id}: resuming OTA at {ack.offset}/{size}')
+
+            offset = ack.offset  # how many bytes the device has
+            stalled = 0
+
+            with open(filename, 'rb') as fd:
+                while offset < size:
+                    fd.seek(offset)
+                    data = fd.read(chunk_size)
+                    ack = await self._ota_request(queue, f'{topic}/chunk',
+                                                  OTAChunkPayload(secret=device.secret, offset=offset, data=data),
+                                                  OTAAckPayload, timeout, retries)
+                    self._check_ota_ack(device.id, ack)
+
+                    if ack.offset == offset + len(data):
+                        offset = ack.offset
+                        stalled = 0
+                        if progress_callback:
+                            progress_callback(device.id, offset, size)
+                        continue
+
+                    if ack.offset < offset:
+                        raise RuntimeError(f'{device.id}: device lost OTA progress ({ack.offset} < {offset})')
+
+                    stalled += 1
+                    if stalled >= retries:
+                        raise RuntimeError(f'{device.id}: OTA is stuck at offset {offset}')
+                    offset = ack.offset
+
+                if offset > size:
+                    raise RuntimeError(f'{device.id}: device reported offset {offset} beyond the end of file')
+
+            return await self._ota_request(queue, f'{topic}/end',
+                                           OTAEndPayload(secret=device.secret, md5=md5),
+                                           OTAResultPayload, timeout, retries)
+        finally:
+            del self._ota_queues[device.id]
+
+    async def _ota_request(self, queue: asyncio.Queue, topic: str, payload: MQTTPayload, response_type, timeout, retries):
+        for attempt in range(retries):
+            # drop acks left from previous retransmissions
+            while not queue.empty():
+                queue.get_nowait()
+
+            try:
+                await asyncio.wait_for(self.publish(topic, payload=payload.pack(), qos=1), timeout)
+                while True:
+                    response = await asyncio.wait_for(queue.get(), timeout)
+                    if isinstance(response, response_type):
+                        return response
+            except asyncio.TimeoutError:
+                self._logger.warning(f'{topic}: no response in {timeout} s (attempt {attempt+1}/{retries})')
+            except ConnectionError as e:
+                # give it time to reconnect
+                self._logger.warning(f'{topic}: {str(e)} (attempt {attempt+1}/{retries})')
+                await asyncio.sleep(timeout)
+
+        raise TimeoutError(f'{topic}: no response after {retries} attempts')
+
+    @staticmethod
+    def _check_ota_ack(device_id: str, ack: OTAAckPayload):
+        if ack.result != 0:
+            raise RuntimeError(f'{device_id}: OTA failed on the device, result={ack.result}')
+
+    async def watch(self) -> AsyncIterator[Tuple[str, 'MQTTRelayState']]:
+        """
+        Yields (device_id, state) every time the power state of a device changes.
+        """
+        queue = asyncio.Queue()
+        self._watchers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._watchers.remove(queue)
+
+
 class MQTTRelayState:
     enabled: bool
     update_time: datetime.datetime
@@ -138,3 +364,31 @@ class MQTTRelayState:
         self.update_time = datetime.datetime.now()
         if fw_version:
             self.fw_version = fw_version
+
+
+def _unpack_message(msg, devices: list[MQTTRelayDevice]) -> Optional[Tuple[str, Optional[MQTTPayload]]]:
+    match = re.match(r'^hk/(.*?)/relay/(stat|stat1|power|otares|otaack)$', msg.topic)
+    if not match:
+        return None
+
+    device_id = match.group(1)
+    subtopic = match.group(2)
+
+    try:
+        next(d for d in devices if d.id == device_id)
+    except StopIteration:
+        return None
+
+    message = None
+    if subtopic == 'stat':
+        message = StatPayload.unpack(msg.payload)
+    elif subtopic == 'stat1':
+        message = InitialStatPayload.unpack(msg.payload)
+    elif subtopic == 'power':
+        message = PowerPayload.unpack(msg.payload)
+    elif subtopic == 'otares':
+        message = OTAResultPayload.unpack(msg.payload)
+    elif subtopic == 'otaack':
+        message = OTAAckPayload.unpack(msg.payload)
+
+    return device_id, message
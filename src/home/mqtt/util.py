@@ -6,3 +6,43 @@ def poll_tick(freq):
     while True:
         t += freq
         yield max(t - time.time(), 0)
+
+
+class DeadbandFilter:
+    """
+    Decides whether a sample is worth publishing: returns True when at least one
+    field has moved away from the last published value by more than its deadband,
+    or when the heartbeat interval has expired. Fields without a configured
+    deadband trigger on any change.
+    """
+
+    def __init__(self, deadbands: dict, heartbeat: float):
+        self._deadbands = deadbands
+        self._heartbeat = heartbeat
+        self._last = None
+        self._last_time = 0
+
+    def check(self, data: dict, now: float = None) -> bool:
+        if now is None:
+            now = time.time()
+
+        if self._last is None or now - self._last_time >= self._heartbeat or self._exceeded(data):
+            self._last = dict(data)
+            self._last_time = now
+            return True
+
+        return False
+
+    def _exceeded(self, data: dict) -> bool:
+        for k, v in data.items():
+            if k not in self._last:
+                return True
+
+            prev = self._last[k]
+            if isinstance(v, (int, float)) and isinstance(prev, (int, float)) and not isinstance(v, bool):
+                if abs(v - prev) > self._deadbands.get(k, 0):
+                    return True
+            elif v != prev:
+                return True
+
+        return False
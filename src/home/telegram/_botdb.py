@@ -1,8 +1,15 @@
+import threading
+
 from home.database.sqlite import SQLiteBase
 
 
 class BotDatabase(SQLiteBase):
     def __init__(self):
+        # languages are read on every message and every notification, and only
+        # change through set_user_lang(), so they're cached
+        self._langs = {}
+        self._langs_lock = threading.Lock()
+
         super().__init__()
 
     def schema_init(self, version: int) -> None:
@@ -15,6 +22,10 @@ class BotDatabase(SQLiteBase):
             self.commit()
 
     def get_user_lang(self, user_id: int, default: str = 'en') -> str:
+        with self._langs_lock:
+            if user_id in self._langs:
+                return self._langs[user_id]
+
         cursor = self.cursor()
         cursor.execute('SELECT lang FROM users WHERE id=?', (user_id,))
         row = cursor.fetchone()
@@ -22,11 +33,32 @@ class BotDatabase(SQLiteBase):
         if row is None:
             cursor.execute('INSERT INTO users (id, lang) VALUES (?, ?)', (user_id, default))
             self.commit()
-            return default
+            lang = default
         else:
-            return row[0]
+            lang = row[0]
+
+        with self._langs_lock:
+            self._langs[user_id] = lang
+        return lang
+
+    def get_user_langs(self, user_ids: list[int], default: str = 'en') -> dict[int, str]:
+        with self._langs_lock:
+            missing = [user_id for user_id in user_ids if user_id not in self._langs]
+
+        if missing:
+            cursor = self.cursor()
+            placeholders = ', '.join(['?'] * len(missing))
+            cursor.execute(f'SELECT id, lang FROM users WHERE id IN ({placeholders})', missing)
+            with self._langs_lock:
+                self._langs.update(cursor.fetchall())
+
+        # unknown users are added with the default language
+        return {user_id: self.get_user_lang(user_id, default) for user_id in user_ids}
 
     def set_user_lang(self, user_id: int, lang: str) -> None:
         cursor = self.cursor()
         cursor.execute('UPDATE users SET lang=? WHERE id=?', (lang, user_id))
         self.commit()
+
+        with self._langs_lock:
+            self._langs[user_id] = lang
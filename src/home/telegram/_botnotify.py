@@ -0,0 +1,193 @@
+import time
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest, Unauthorized, ChatMigrated
+
+_logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket shared by all senders."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # the token is taken now, possibly in advance, and waited for outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        # nothing is sent by anyone for the given time, then at the usual rate
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class NotifyStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0     # errors that are not retried
+        self.dropped = 0    # given up after all attempts
+        self.retried = 0
+        self.latency_total = 0.
+        self.latency_max = 0.
+        self.latency_last = 0.
+        self._lock = threading.Lock()
+
+    def delivered(self, latency: float):
+        with self._lock:
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_last = latency
+
+    def retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'retried': self.retried,
+                'latency_avg': self.latency_total / self.sent if self.sent else 0.,
+                'latency_max': self.latency_max,
+                'latency_last': self.latency_last,
+            }
+
+
+class Notifier:
+    """
+    Sends notifications to many users at once, from a thread pool. Messages to
+    the same user are sent one by one, in order. Sending is limited to rate
+    messages per second overall (Telegram allows about 30), and a message
+    is retried after RetryAfter (what Telegram responds with when flooded,
+    all sending is paused then) and network errors. TimedOut isn't retried,
+    as the message may have been delivered anyway, and neither are errors
+    that would repeat (bad request, blocked by the user, migrated chat).
+    """
+
+    def __init__(self,
+                 send: Callable[[int, str], None],
+                 workers: int = 8,
+                 rate: float = 25,
+                 attempts: int = 3):
+        self.send = send
+        self.attempts = attempts
+        self.stats = NotifyStats()
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notify')
+        self._limiter = RateLimiter(rate, burst=workers)
+        self._lock = threading.Lock()
+        self._queues = {}    # user_id => deque of (text, time queued)
+        self._active = set()
+
+    def submit(self, user_id: int, text: str):
+        with self._lock:
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+            self._queues[user_id].append((text, time.monotonic()))
+            if user_id in self._active:
+                # its worker will get to it
+                return
+            self._active.add(user_id)
+        self._executor.submit(self._drain, user_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def dump_stats(self) -> dict:
+        return {**self.stats.as_dict(), 'pending': self.pending()}
+
+    def format_stats(self) -> str:
+        lines = []
+        for k, v in self.dump_stats().items():
+            if isinstance(v, float):
+                v = f'{v:.3f}'
+            lines.append(f'{k}: {v}')
+        return '\n'.join(lines)
+
+    def _drain(self, user_id: int):
+        while True:
+            with self._lock:
+                queue = self._queues[user_id]
+                if not queue:
+                    self._active.discard(user_id)
+                    return
+                text, queued = queue.popleft()
+            self._deliver(user_id, text, queued)
+
+    def _deliver(self, user_id: int, text: str, queued: float):
+        for attempt in range(self.attempts):
+            last = attempt == self.attempts - 1
+            self._limiter.acquire()
+            try:
+                self.send(user_id, text)
+                self.stats.delivered(time.monotonic() - queued)
+                return
+
+            except RetryAfter as e:
+                # the limit is for the bot, not for this user, the next acquire() waits for it
+                self._limiter.pause(e.retry_after)
+                if last:
+                    _logger.error(f'notify {user_id}: flood control, giving up')
+                    break
+                _logger.warning(f'notify {user_id}: flood control, retrying in {e.retry_after} s')
+                delay = 0
+
+            except TimedOut as e:
+                _logger.error(f'notify {user_id}: timed out, not retrying: {str(e)}')
+                self.stats.failure()
+                return
+
+            # BadRequest is a NetworkError in python-telegram-bot, so it goes first
+            except (BadRequest, Unauthorized, ChatMigrated) as e:
+                _logger.error(f'notify {user_id}: {str(e)}, not retrying')
+                self.stats.failure()
+                return
+
+            except NetworkError as e:
+                if last:
+                    _logger.error(f'notify {user_id}: {str(e)}, giving up')
+                    break
+                _logger.warning(f'notify {user_id}: {str(e)}, retrying')
+                delay = 2 ** attempt
+
+            except Exception as e:
+                _logger.exception(e)
+                self.stats.failure()
+                return
+
+            self.stats.retry()
+            if delay:
+                time.sleep(delay)
+
+        self.stats.drop()
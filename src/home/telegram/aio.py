@@ -1,18 +1,221 @@
-import functools
 import asyncio
+import json
+import logging
+import os.path
+import aiohttp
 
-from .telegram import (
-    send_message as _send_message_sync,
-    send_photo as _send_photo_sync
-)
+from typing import Optional
+from ..config import config
 
+_logger = logging.getLogger(__name__)
 
-async def send_message(*args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, functools.partial(_send_message_sync, *args, **kwargs))
+# sendMediaGroup takes from 2 to 10 items
+MediaGroupMax = 10
 
 
-async def send_photo(*args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, functools.partial(_send_photo_sync, *args, **kwargs))
+class TelegramSender:
+    """
+    Sends to a Telegram chat over one keep-alive aiohttp session. Requests go
+    through a bounded queue (callers wait when it's full) and are sent one at
+    a time, in order. When Telegram asks to slow down (429 with retry_after),
+    the request is repeated after the given delay; connection and server
+    errors are retried a few times with backoff. A timeout or a response that
+    can't be read isn't retried, as the message may have been sent anyway.
 
+    The session belongs to the event loop it was created on, call close()
+    before that loop is stopped.
+    """
+
+    api_url = 'https://api.telegram.org'
+
+    def __init__(self,
+                 token: str,
+                 chat_id,
+                 queue_size: int = 100,
+                 parse_mode: str = None,
+                 disable_web_page_preview: bool = False,
+                 timeout: float = 30,
+                 attempts: int = 3):
+        self.token = token
+        self.chat_id = chat_id
+        self.parse_mode = parse_mode
+        self.disable_web_page_preview = disable_web_page_preview
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.attempts = attempts
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker = None
+        self._loop = None
+
+    async def send_message(self, text: str,
+                           parse_mode: str = None,
+                           disable_web_page_preview: bool = False) -> dict:
+        data = {
+            'chat_id': self.chat_id,
+            'text': text
+        }
+        if parse_mode is None:
+            parse_mode = self.parse_mode
+        if parse_mode is not None:
+            data['parse_mode'] = parse_mode
+        if disable_web_page_preview or self.disable_web_page_preview:
+            data['disable_web_page_preview'] = 1
+        return await self._request('sendMessage', data)
+
+    async def send_photo(self, filename: str, caption: str = None) -> dict:
+        return await self.send_photos([filename], caption=caption)
+
+    async def send_photos(self, filenames: list[str], caption: str = None) -> list[dict]:
+        """
+        Sends photos as albums, up to 10 in each (a single photo is sent with
+        sendPhoto). The files are read right away, so they may be overwritten
+        as soon as this is called. Returns responses of all requests.
+        """
+        loop = asyncio.get_running_loop()
+        photos = []
+        for filename in filenames:
+            photos.append((os.path.basename(filename), await loop.run_in_executor(None, _read_file, filename)))
+
+        responses = []
+        for i in range(0, len(photos), MediaGroupMax):
+            group = photos[i:i+MediaGroupMax]
+            group_caption = caption if i == 0 else None
+            if len(group) == 1:
+                name, content = group[0]
+                fields = {'chat_id': self.chat_id}
+                if group_caption:
+                    fields['caption'] = group_caption
+                responses.append(await self._request('sendPhoto', fields, files={'photo': (name, content)}))
+            else:
+                media = []
+                files = {}
+                for j, (name, content) in enumerate(group):
+                    item = {'type': 'photo', 'media': f'attach://photo{j}'}
+                    if j == 0 and group_caption:
+                        item['caption'] = group_caption
+                    media.append(item)
+                    files[f'photo{j}'] = (name, content)
+                fields = {'chat_id': self.chat_id, 'media': json.dumps(media)}
+                responses.append(await self._request('sendMediaGroup', fields, files=files))
+
+        return responses[0] if len(filenames) == 1 else responses
+
+    async def close(self):
+        if self._worker:
+            await self._queue.join()
+            self._worker.cancel()
+            self._worker = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, fields: dict, files: dict = None) -> dict:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._loop is not loop:
+            # the previous loop is gone along with the session and the worker
+            self._loop = loop
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  connector=aiohttp.TCPConnector(limit=1, keepalive_timeout=60))
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.create_task(self._work())
+
+        future = loop.create_future()
+        await self._queue.put((method, fields, files, future))
+        return await future
+
+    async def _work(self):
+        while True:
+            method, fields, files, future = await self._queue.get()
+            try:
+                future.set_result(await self._send(method, fields, files))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, method: str, fields: dict, files: Optional[dict]) -> dict:
+        url = f'{self.api_url}/bot{self.token}/{method}'
+        attempt = 0
+        while True:
+            # form data can't be reused, build it on every attempt
+            data = aiohttp.FormData()
+            for k, v in fields.items():
+                data.add_field(k, str(v))
+            for k, (name, content) in (files or {}).items():
+                data.add_field(k, content, filename=name)
+
+            status = None
+            try:
+                async with self._session.post(url, data=data) as response:
+                    status = response.status
+                    # the body of a server error is likely an HTML page from a proxy
+                    body = await response.json(content_type=None) if status < 500 else None
+
+            except asyncio.TimeoutError:
+                raise ConnectionError(f'{method}: timed out, not retrying')
+
+            except (ValueError, aiohttp.ClientPayloadError):
+                # the request went through, but the response is not JSON or is cut off
+                raise ConnectionError(f'{method}: invalid response (HTTP {status}), not retrying')
+
+            except aiohttp.ClientError as e:
+                error = str(e) or e.__class__.__name__
+
+            else:
+                if status == 429:
+                    retry_after = body.get('parameters', {}).get('retry_after', 1)
+                    _logger.warning(f'{method}: flood control, retrying in {retry_after} s')
+                    await asyncio.sleep(retry_after)
+                    continue
+
+                if status < 500:
+                    if not body.get('ok'):
+                        _logger.error(f'{method}: {body.get("description")}')
+                    return body
+
+                error = f'server error {status}'
+
+            attempt += 1
+            if attempt >= self.attempts:
+                raise ConnectionError(f'{method}: {error}')
+            _logger.warning(f'{method}: {error}, retrying')
+            await asyncio.sleep(2 ** attempt)
+
+
+def _read_file(filename: str) -> bytes:
+    with open(filename, 'rb') as fd:
+        return fd.read()
+
+
+_sender: Optional[TelegramSender] = None
+
+
+def _get_sender() -> TelegramSender:
+    global _sender
+    if _sender is None:
+        _sender = TelegramSender(config['telegram']['token'],
+                                 config['telegram']['chat_id'],
+                                 parse_mode=config['telegram'].get('parse_mode', None),
+                                 disable_web_page_preview='disable_web_page_preview' in config['telegram'],
+                                 queue_size=config['telegram'].get('queue_size', 100))
+    return _sender
+
+
+async def send_message(*args, **kwargs) -> dict:
+    return await _get_sender().send_message(*args, **kwargs)
+
+
+async def send_photo(*args, **kwargs) -> dict:
+    return await _get_sender().send_photo(*args, **kwargs)
+
+
+async def send_photos(*args, **kwargs) -> list[dict]:
+    return await _get_sender().send_photos(*args, **kwargs)
+
+
+async def close():
+    if _sender is not None:
+        await _sender.close()
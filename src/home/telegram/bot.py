@@ -28,6 +28,7 @@ from ._botlang import lang, languages
 from ._botdb import BotDatabase
 from ._botutil import ReportingHelper, exc2text, IgnoreMarkup, user_any_name
 from ._botcontext import Context
+from ._botnotify import Notifier
 
 
 db: Optional[BotDatabase] = None
@@ -44,6 +45,7 @@ _exception_handler: Optional[callable] = None
 _dispatcher = None
 _markup_getter: Optional[callable] = None
 _start_handler_ref: Optional[callable] = None
+_notifier: Optional[Notifier] = None
 
 
 def text_filter(*args):
@@ -443,6 +445,7 @@ def initialize():
     global _user_filter
     global _updater
     global _dispatcher
+    global _notifier
 
     # init user_filter
     if 'users' in config['bot']:
@@ -453,7 +456,17 @@ def initialize():
 
     # init updater
     _updater = Updater(config['bot']['token'],
-                       request_kwargs={'read_timeout': 6, 'connect_timeout': 7})
+                       request_kwargs={'read_timeout': 6, 'connect_timeout': 7,
+                                       # 8 is what the updater needs by default, the rest is for notifications
+                                       'con_pool_size': 8 + config['bot'].get('notify_workers', 8)})
+
+    # init notifier
+    _notifier = Notifier(send=_send_notification,
+                         workers=config['bot'].get('notify_workers', 8),
+                         rate=config['bot'].get('notify_rate', 25))
+    interval = config['bot'].get('notify_stats_interval', 3600)
+    if interval:
+        _updater.job_queue.run_repeating(_log_notify_stats, interval=interval, first=interval)
 
     # transparently log all messages
     _updater.dispatcher.add_handler(MessageHandler(Filters.all & _user_filter, _logging_message_handler), group=10)
@@ -475,6 +488,7 @@ def run(start_handler=None, any_handler=None):
 
     _updater.dispatcher.add_handler(LangConversation().get_handler(), group=0)
     _updater.dispatcher.add_handler(CommandHandler('start', simplehandler(start_handler), _user_filter))
+    _updater.dispatcher.add_handler(CommandHandler('notifystats', _notify_stats_handler, _user_filter))
     _updater.dispatcher.add_handler(MessageHandler(Filters.all & _user_filter, any_handler))
 
     _updater.start_polling()
@@ -526,18 +540,50 @@ def enable_logging(bot_type: BotType):
 
 def notify_all(text_getter: callable,
                exclude: Tuple[int] = ()) -> None:
+    """
+    Queues the notification for all notify_users and returns; messages are
+    delivered concurrently, see Notifier. text_getter is called once per
+    language.
+    """
     if 'notify_users' not in config['bot']:
         _logger.error('notify_all() called but no notify_users directive found in the config')
         return
 
-    for user_id in config['bot']['notify_users']:
-        if user_id in exclude:
-            continue
+    user_ids = [user_id for user_id in config['bot']['notify_users'] if user_id not in exclude]
+    langs = db.get_user_langs(user_ids)
 
-        text = text_getter(db.get_user_lang(user_id))
-        _updater.bot.send_message(chat_id=user_id,
-                                  text=text,
-                                  parse_mode='HTML')
+    texts = {}
+    for user_id in user_ids:
+        lang = langs[user_id]
+        if lang not in texts:
+            texts[lang] = text_getter(lang)
+        _notifier.submit(user_id, texts[lang])
+
+
+def notify_stats() -> dict:
+    """
+    Delivery counters and latencies (in seconds, from notify_all() to sent) of
+    notify_all(). Also shown by the /notifystats command and logged every
+    bot.notify_stats_interval seconds (an hour by default, 0 turns it off).
+    """
+    return _notifier.dump_stats()
+
+
+@simplehandler
+def _notify_stats_handler(ctx: Context):
+    ctx.reply(_notifier.format_stats())
+
+
+def _log_notify_stats(_: CallbackContext):
+    stats = _notifier.dump_stats()
+    if stats['sent'] or stats['failed'] or stats['dropped'] or stats['pending']:
+        _logger.info('notify stats: ' + _notifier.format_stats().replace('\n', ', '))
+
+
+def _send_notification(user_id: int, text: str) -> None:
+    _updater.bot.send_message(chat_id=user_id,
+                              text=text,
+                              parse_mode='HTML')
 
 
 def notify_user(user_id: int, text: Union[str, Exception], **kwargs) -> None:
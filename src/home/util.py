@@ -9,7 +9,7 @@ import random
 
 from enum import Enum
 from datetime import datetime
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Callable
 
 Addr = Tuple[str, int]  # network address type (host, port)
 
@@ -147,27 +147,28 @@ class Stopwatch:
     elapsed: float
     time_started: Optional[float]
 
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float] = time.time):
         self.elapsed = 0
         self.time_started = None
+        self.clock = clock
 
     def go(self):
         if self.time_started is not None:
             raise StopwatchError('stopwatch was already started')
 
-        self.time_started = time.time()
+        self.time_started = self.clock()
 
     def pause(self):
         if self.time_started is None:
             raise StopwatchError('stopwatch was paused')
 
-        self.elapsed += time.time() - self.time_started
+        self.elapsed += self.clock() - self.time_started
         self.time_started = None
 
     def get_elapsed_time(self):
         elapsed = self.elapsed
         if self.time_started is not None:
-            elapsed += time.time() - self.time_started
+            elapsed += self.clock() - self.time_started
         return elapsed
 
     def reset(self):
@@ -4,6 +4,7 @@ import re
 import datetime
 import json
 import itertools
+import threading
 
 from inverterd import Format, InverterError
 from html import escape
@@ -14,8 +15,10 @@ from home.config import config
 from home.telegram import bot
 from home.inverter import (
     wrapper_instance as inverter,
+    poller_instance as poller,
     beautify_table,
     InverterMonitor,
+    MonitorJournal,
 )
 from home.inverter.types import (
     ChargingEvent,
@@ -69,6 +72,8 @@ bot.lang.ru(
 
     # generation
     gen_input_power='Зарядная мощность',
+    gen_month='Генерация за месяц',
+    gen_backfilling='⏳ Данные за %d дн. загружаются из инвертора, повторите запрос позже.',
 
     # settings
     settings_msg="Что вы хотите настроить?",
@@ -192,6 +197,8 @@ bot.lang.en(
 
     # generation
     gen_input_power='Input power',
+    gen_month='Generation this month',
+    gen_backfilling='⏳ Data for %d day(s) is being loaded from the inverter, try again later.',
 
     # time and date
     today='Today',
@@ -665,12 +672,18 @@ class ConsumptionConversation(bot.conversation):
                   markup=bot.IgnoreMarkup())
 
         api = WebAPIClient(timeout=60)
-        method = 'inverter_get_consumed_energy' if state == self.TOTAL else 'inverter_get_grid_consumed_energy'
 
         try:
-            wh = getattr(api, method)(s_from, s_to)
+            if state == self.TOTAL:
+                text = '%.2f Wh' % (api.inverter_get_consumed_energy(s_from, s_to),)
+            else:
+                # per-day breakdown comes at no extra cost
+                result = api.inverter_get_grid_consumed_energy(s_from, s_to, breakdown=True)
+                text = '%.2f Wh' % (result['wh'],)
+                if len(result['days']) > 1:
+                    text += '\n\n' + '\n'.join('%s: %.2f Wh' % (day, wh) for day, wh in result['days'])
             bot.delete_message(message.chat_id, message.message_id)
-            ctx.reply('%.2f Wh' % (wh,),
+            ctx.reply(text,
                       markup=bot.IgnoreMarkup())
             return self.END
         except Exception as e:
@@ -745,8 +758,8 @@ def exception_handler(e: Exception, ctx: bot.Context) -> Optional[bool]:
 
 @bot.handler(message='status')
 def status_handler(ctx: bot.Context) -> None:
-    gs = inverter.exec('get-status')['data']
-    rated = inverter.exec('get-rated')['data']
+    gs = poller.get_status()
+    rated = poller.get_rated()
 
     # render response
     power_direction = gs['battery_power_direction'].lower()
@@ -791,40 +804,96 @@ def status_handler(ctx: bot.Context) -> None:
     ctx.reply(html)
 
 
+def get_generation(days: list[datetime.date]) -> dict:
+    """
+    Returns Wh generated per day. Closed days are fetched from the inverter only
+    once, then read from the database; today is always fetched.
+    """
+    today = datetime.date.today()
+    result = bot.db.get_generation([d for d in days if d < today])
+    missing = [d for d in days if d not in result]
+
+    if missing:
+        responses = inverter.exec_many([('get-day-generated', (d.year, d.month, d.day)) for d in missing])
+        for d, response in zip(missing, responses):
+            result[d] = response['data']['wh']
+            if d < today:
+                bot.db.set_generation(d, result[d])
+
+    return result
+
+
+_backfill_lock = threading.Lock()
+
+
+def backfill_generation(days: list[datetime.date]) -> None:
+    # one day per request, so that user requests don't wait for the whole backfill
+    if not _backfill_lock.acquire(blocking=False):
+        return
+    try:
+        for d in days:
+            try:
+                get_generation([d])
+            except Exception as e:
+                logger.exception(e)
+                break
+    finally:
+        _backfill_lock.release()
+
+
 @bot.handler(message='generation')
 def generation_handler(ctx: bot.Context) -> None:
     today = datetime.date.today()
     yday = today - datetime.timedelta(days=1)
     yday2 = today - datetime.timedelta(days=2)
 
-    gs = inverter.exec('get-status')['data']
-
-    gen_today = inverter.exec('get-day-generated', (today.year, today.month, today.day))['data']
-    gen_yday = None
-    gen_yday2 = None
+    gs = poller.get_status()
 
+    days = [today]
     if yday.month == today.month:
-        gen_yday = inverter.exec('get-day-generated', (yday.year, yday.month, yday.day))['data']
-
+        days.append(yday)
     if yday2.month == today.month:
-        gen_yday2 = inverter.exec('get-day-generated', (yday2.year, yday2.month, yday2.day))['data']
+        days.append(yday2)
+
+    gen = get_generation(days)
 
     # render response
     html = f'<b>{ctx.lang("gen_input_power")}:</b> %s %s' % (gs['pv1_input_power']['value'], gs['pv1_input_power']['unit'])
     html += ' (%s %s)' % (gs['pv1_input_voltage']['value'], gs['pv1_input_voltage']['unit'])
 
-    html += f'\n<b>{ctx.lang("today")}:</b> %s Wh' % (gen_today['wh'])
+    html += f'\n<b>{ctx.lang("today")}:</b> %s Wh' % (gen[today])
 
-    if gen_yday is not None:
-        html += f'\n<b>{ctx.lang("yday1")}:</b> %s Wh' % (gen_yday['wh'])
+    if yday in gen:
+        html += f'\n<b>{ctx.lang("yday1")}:</b> %s Wh' % (gen[yday])
 
-    if gen_yday2 is not None:
-        html += f'\n<b>{ctx.lang("yday2")}:</b> %s Wh' % (gen_yday2['wh'])
+    if yday2 in gen:
+        html += f'\n<b>{ctx.lang("yday2")}:</b> %s Wh' % (gen[yday2])
 
     # send response
     ctx.reply(html)
 
 
+@bot.handler(command='genmonth')
+def generation_month_handler(ctx: bot.Context) -> None:
+    today = datetime.date.today()
+    past_days = [today.replace(day=n) for n in range(1, today.day)]
+
+    # past days come from the database, missing ones are loaded in background
+    gen = bot.db.get_generation(past_days)
+    gen.update(get_generation([today]))
+    missing = [d for d in past_days if d not in gen]
+
+    html = f'<b>{ctx.lang("gen_month")}:</b> %d Wh\n' % sum(gen.values())
+    for d in reversed(past_days + [today]):
+        html += f'\n{d.strftime(FormatDate)}: ' + (f'{gen[d]} Wh' if d in gen else '…')
+
+    if missing:
+        threading.Thread(target=backfill_generation, args=(missing,), daemon=True).start()
+        html += '\n\n' + ctx.lang('gen_backfilling', len(missing))
+
+    ctx.reply(html)
+
+
 @bot.defaultreplymarkup
 def markup(ctx: Optional[bot.Context]) -> Optional[ReplyKeyboardMarkup]:
     button = [
@@ -836,7 +905,7 @@ def markup(ctx: Optional[bot.Context]) -> Optional[ReplyKeyboardMarkup]:
 
 
 class InverterStore(bot.BotDatabase):
-    SCHEMA = 2
+    SCHEMA = 3
 
     def schema_init(self, version: int) -> None:
         super().schema_init(version)
@@ -850,6 +919,14 @@ class InverterStore(bot.BotDatabase):
             cursor.execute("CREATE INDEX param_id_idx ON params (id)")
             self.commit()
 
+        if version < 3:
+            cursor = self.cursor()
+            cursor.execute("""CREATE TABLE IF NOT EXISTS generation (
+                day TEXT NOT NULL PRIMARY KEY,
+                wh INTEGER NOT NULL
+            )""")
+            self.commit()
+
     def get_param(self, key: str, default=None):
         cursor = self.cursor()
         cursor.execute('SELECT value FROM params WHERE id=?', (key,))
@@ -862,6 +939,20 @@ class InverterStore(bot.BotDatabase):
         cursor.execute('REPLACE INTO params (id, value) VALUES (?, ?)', (key, str(value)))
         self.commit()
 
+    def get_generation(self, days: list[datetime.date]) -> dict:
+        if not days:
+            return {}
+        cursor = self.cursor()
+        placeholders = ', '.join(['?'] * len(days))
+        cursor.execute(f'SELECT day, wh FROM generation WHERE day IN ({placeholders})',
+                       [d.strftime(FormatDate) for d in days])
+        return {datetime.datetime.strptime(day, FormatDate).date(): wh for day, wh in cursor.fetchall()}
+
+    def set_generation(self, day: datetime.date, wh: int):
+        cursor = self.cursor()
+        cursor.execute('REPLACE INTO generation (day, wh) VALUES (?, ?)', (day.strftime(FormatDate), wh))
+        self.commit()
+
 
 if __name__ == '__main__':
     inverter.init(host=config['inverter']['ip'], port=config['inverter']['port'])
@@ -872,12 +963,19 @@ if __name__ == '__main__':
     bot.add_conversation(SettingsConversation(enable_back=True))
     bot.add_conversation(ConsumptionConversation(enable_back=True))
 
+    poller.configure(status_interval=config['inverter'].get('status_poll_interval', 2),
+                     rated_interval=config['inverter'].get('rated_poll_interval', 300))
+    poller.start()
+
     monitor = InverterMonitor()
     monitor.set_charging_event_handler(monitor_charging)
     monitor.set_battery_event_handler(monitor_battery)
     monitor.set_util_event_handler(monitor_util)
     monitor.set_error_handler(monitor_error)
     monitor.set_osp_need_change_callback(osp_change_cb)
+    if config.get('monitor.journal'):
+        monitor.set_journal(MonitorJournal(config['monitor']['journal'],
+                                           max_age=config['monitor'].get('journal_max_age', 3600)))
 
     setacmode(getacmode())
 
@@ -888,3 +986,4 @@ if __name__ == '__main__':
     bot.run()
 
     monitor.stop()
+    poller.stop()
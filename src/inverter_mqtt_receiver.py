@@ -4,11 +4,41 @@ import re
 import logging
 
 from home.mqtt import MQTTBase
-from home.mqtt.payload.inverter import Status, Generation
+from home.mqtt.payload.inverter import Status, StatusBatch, Generation
 from home.database import InverterDatabase
 from home.config import config
 
 
+def _status_to_db(s: Status) -> dict:
+    return dict(client_time=s.time,
+                grid_voltage=int(s.grid_voltage*10),
+                grid_freq=int(s.grid_freq * 10),
+                ac_output_voltage=int(s.ac_output_voltage * 10),
+                ac_output_freq=int(s.ac_output_freq * 10),
+                ac_output_apparent_power=s.ac_output_apparent_power,
+                ac_output_active_power=s.ac_output_active_power,
+                output_load_percent=s.output_load_percent,
+                battery_voltage=int(s.battery_voltage * 10),
+                battery_voltage_scc=int(s.battery_voltage_scc * 10),
+                battery_voltage_scc2=int(s.battery_voltage_scc2 * 10),
+                battery_discharge_current=s.battery_discharge_current,
+                battery_charge_current=s.battery_charge_current,
+                battery_capacity=s.battery_capacity,
+                inverter_heat_sink_temp=s.inverter_heat_sink_temp,
+                mppt1_charger_temp=s.mppt1_charger_temp,
+                mppt2_charger_temp=s.mppt2_charger_temp,
+                pv1_input_power=s.pv1_input_power,
+                pv2_input_power=s.pv2_input_power,
+                pv1_input_voltage=int(s.pv1_input_voltage * 10),
+                pv2_input_voltage=int(s.pv2_input_voltage * 10),
+                mppt1_charger_status=s.mppt1_charger_status,
+                mppt2_charger_status=s.mppt2_charger_status,
+                battery_power_direction=s.battery_power_direction,
+                dc_ac_power_direction=s.dc_ac_power_direction,
+                line_power_direction=s.line_power_direction,
+                load_connected=s.load_connected)
+
+
 class MQTTReceiver(MQTTBase):
     def __init__(self):
         super().__init__(clean_session=False)
@@ -21,7 +51,7 @@ class MQTTReceiver(MQTTBase):
 
     def on_message(self, client: mqtt.Client, userdata, msg):
         try:
-            match = re.match(r'(?:home|hk)/(\d+)/(status|gen)', msg.topic)
+            match = re.match(r'(?:home|hk)/(\d+)/(status_batch|status|gen)', msg.topic)
             if not match:
                 return
 
@@ -33,34 +63,11 @@ class MQTTReceiver(MQTTBase):
 
             elif what == 'status':
                 s = Status.unpack(msg.payload)
-                self.database.add_status(home_id,
-                                         client_time=s.time,
-                                         grid_voltage=int(s.grid_voltage*10),
-                                         grid_freq=int(s.grid_freq * 10),
-                                         ac_output_voltage=int(s.ac_output_voltage * 10),
-                                         ac_output_freq=int(s.ac_output_freq * 10),
-                                         ac_output_apparent_power=s.ac_output_apparent_power,
-                                         ac_output_active_power=s.ac_output_active_power,
-                                         output_load_percent=s.output_load_percent,
-                                         battery_voltage=int(s.battery_voltage * 10),
-                                         battery_voltage_scc=int(s.battery_voltage_scc * 10),
-                                         battery_voltage_scc2=int(s.battery_voltage_scc2 * 10),
-                                         battery_discharge_current=s.battery_discharge_current,
-                                         battery_charge_current=s.battery_charge_current,
-                                         battery_capacity=s.battery_capacity,
-                                         inverter_heat_sink_temp=s.inverter_heat_sink_temp,
-                                         mppt1_charger_temp=s.mppt1_charger_temp,
-                                         mppt2_charger_temp=s.mppt2_charger_temp,
-                                         pv1_input_power=s.pv1_input_power,
-                                         pv2_input_power=s.pv2_input_power,
-                                         pv1_input_voltage=int(s.pv1_input_voltage * 10),
-                                         pv2_input_voltage=int(s.pv2_input_voltage * 10),
-                                         mppt1_charger_status=s.mppt1_charger_status,
-                                         mppt2_charger_status=s.mppt2_charger_status,
-                                         battery_power_direction=s.battery_power_direction,
-                                         dc_ac_power_direction=s.dc_ac_power_direction,
-                                         line_power_direction=s.line_power_direction,
-                                         load_connected=s.load_connected)
+                self.database.add_status(home_id, **_status_to_db(s))
+
+            elif what == 'status_batch':
+                batch = StatusBatch.unpack(msg.payload)
+                self.database.add_status_batch(home_id, [_status_to_db(s) for s in batch.statuses])
 
         except Exception as e:
             self._logger.exception(str(e))
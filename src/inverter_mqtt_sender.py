@@ -5,8 +5,8 @@ import json
 import inverterd
 
 from home.config import config
-from home.mqtt import MQTTBase, poll_tick
-from home.mqtt.payload.inverter import Status, Generation
+from home.mqtt import MQTTBase, DeadbandFilter, poll_tick
+from home.mqtt.payload.inverter import Status, StatusBatch, Generation
 
 
 class MQTTClient(MQTTBase):
@@ -23,6 +23,26 @@ class MQTTClient(MQTTBase):
         freq = int(config['mqtt']['inverter']['poll_freq'])
         gen_freq = int(config['mqtt']['inverter']['generation_poll_freq'])
 
+        # batch_size > 1 makes the sender accumulate statuses and publish them
+        # as a single StatusBatch message
+        batch_size = int(config['mqtt']['inverter'].get('batch_size', 1))
+        batch_delta = bool(config['mqtt']['inverter'].get('batch_delta', True))
+        batch_compress = bool(config['mqtt']['inverter'].get('batch_compress', True))
+        batch = []
+
+        # if deadbands are configured, statuses are published only when some field
+        # changes by more than its deadband, or at least once per `heartbeat` seconds
+        status_filter = None
+        if 'deadband' in config['mqtt']['inverter']:
+            heartbeat = int(config['mqtt']['inverter'].get('heartbeat', 300))
+            # InverterDatabase holds a sample for 15 minutes at most, anything longer is counted
+            # as no data; if that's raised there (clickhouse.fill_max_gap), set the same value here
+            fill_max_gap = int(config['mqtt']['inverter'].get('fill_max_gap', 900))
+            if heartbeat >= fill_max_gap:
+                raise ValueError(f'heartbeat of {heartbeat} s must be shorter than fill_max_gap of '
+                                 f'the database ({fill_max_gap} s)')
+            status_filter = DeadbandFilter(config['mqtt']['inverter']['deadband'], heartbeat=heartbeat)
+
         g = poll_tick(freq)
         gen_prev = 0
         while True:
@@ -40,9 +60,24 @@ class MQTTClient(MQTTBase):
             data = json.loads(raw)['data']
             status = Status(time=round(now), **data)  # FIXME this will crash with 99% probability
 
-            self._client.publish(f'hk/{self._home_id}/status',
-                                 payload=status.pack(),
-                                 qos=1)
+            if status_filter is not None and not status_filter.check(data, now):
+                # nothing has changed noticeably, receivers will forward-fill the previous sample
+                pass
+
+            elif batch_size > 1:
+                batch.append(status)
+                if len(batch) >= batch_size:
+                    payload = StatusBatch(statuses=batch,
+                                          delta=batch_delta,
+                                          compress=batch_compress)
+                    self._client.publish(f'hk/{self._home_id}/status_batch',
+                                         payload=payload.pack(),
+                                         qos=1)
+                    batch = []
+            else:
+                self._client.publish(f'hk/{self._home_id}/status',
+                                     payload=status.pack(),
+                                     qos=1)
 
             # read today's generation stat
             now = time.time()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import json
+import time
+import logging
+import inverterd
+
+from argparse import ArgumentParser
+from home.config import config
+from home.mqtt import poll_tick
+from home.inverter.recording import StatusRecorder, status_from_simple_json
+
+logger = logging.getLogger(__name__)
+
+
+# Records get-status to a file that can be played back by inverterd_emulator.py
+# (--recording), and through it by the bot, the monitor or inverter_mqtt_sender,
+# or fed to the monitor directly by test/test_inverter_monitor_sim.py.
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('output', type=str,
+                        help='recording file, appended to if it exists')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8305)
+    parser.add_argument('--interval', type=float, default=2,
+                        help='get-status polling interval, in seconds')
+    parser.add_argument('--chunk-size', type=int, default=300,
+                        help='number of statuses compressed and written at once')
+    args = config.load(False, parser=parser)
+
+    inverter = inverterd.Client(host=args.host, port=args.port)
+    inverter.connect()
+    inverter.format(inverterd.Format.SIMPLE_JSON)
+
+    recorder = StatusRecorder(args.output, chunk_size=args.chunk_size)
+    count = 0
+    g = poll_tick(args.interval)
+    try:
+        while True:
+            time.sleep(next(g))
+
+            now = time.time()
+            try:
+                data = json.loads(inverter.exec('get-status'))['data']
+            except inverterd.InverterError as e:
+                logger.error(f'inverter error: {str(e)}')
+                continue
+
+            recorder.add(status_from_simple_json(data, now))
+            count += 1
+            if count % args.chunk_size == 0:
+                logger.info(f'{count} statuses recorded')
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        recorder.close()
+        logger.info(f'{count} statuses recorded')
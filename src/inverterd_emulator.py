@@ -1,9 +1,46 @@
 #!/usr/bin/env python3
 import logging
 
+from argparse import ArgumentParser
 from home.inverter.emulator import InverterEmulator
+from home.inverter.simulation import Scenario, ScaledClock
+from home.inverter.recording import RecordingModel
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--scenario', type=str,
+                        help='path to a scenario file, see home/inverter/simulation.py')
+    source.add_argument('--recording', type=str,
+                        help='path to a status recording to play back, see inverter_recorder.py')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='how many times faster than real time the scenario or recording runs')
+    parser.add_argument('--latency', type=str, action='append', default=[], metavar='COMMAND=SECONDS',
+                        help='time the device takes to answer a command, * for all other commands; '
+                             'may be repeated, e.g. --latency get-status=0.25 --latency *=0.15')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='random variation of latencies, as a fraction (0.2 is +/- 20%%)')
+    parser.add_argument('--stats', type=float, default=0, metavar='SECONDS',
+                        help='log serial port usage every SECONDS')
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.DEBUG)
-    InverterEmulator(addr=('127.0.0.1', 8305))
+
+    kwargs = dict(latency={},
+                  jitter=args.jitter,
+                  stats_interval=args.stats)
+    for item in args.latency:
+        command, seconds = item.split('=')
+        kwargs['latency'][command] = float(seconds)
+
+    if args.scenario:
+        scenario = Scenario.load(args.scenario)
+        kwargs.update(model=scenario.create_model(),
+                      scenario=scenario,
+                      clock=ScaledClock(args.speed).time)
+    elif args.recording:
+        kwargs.update(model=RecordingModel(args.recording),
+                      clock=ScaledClock(args.speed).time)
+
+    InverterEmulator(addr=('127.0.0.1', 8305), **kwargs)
@@ -30,22 +30,26 @@ limit = 10
 """
 
 
-def main(mac: str, title: str) -> int:
+def main() -> int:
     db = BotsDatabase()
 
-    data = db.get_openwrt_logs(filter_text=mac,
-                               min_id=state['last_id'],
-                               limit=config['openwrt_log_analyzer']['limit'])
-    if not data:
-        return 0
+    devices = config['devices']
+    logs = db.get_openwrt_logs_by_mac(macs=list(devices.values()),
+                                      min_id=state['last_id'],
+                                      limit=config['openwrt_log_analyzer']['limit'])
 
     max_id = 0
-    for log in data:
-        if log.id > max_id:
-            max_id = log.id
+    for title, mac in devices.items():
+        data = logs[mac.lower()]
+        if not data:
+            continue
 
-    text = '\n'.join(map(lambda s: str(s), data))
-    telegram.send_message(f'<b>{title}</b>\n\n' + text)
+        for log in data:
+            if log.id > max_id:
+                max_id = log.id
+
+        text = '\n'.join(map(lambda s: str(s), data))
+        telegram.send_message(f'<b>{title}</b>\n\n' + text)
 
     return max_id
 
@@ -56,11 +60,6 @@ if __name__ == '__main__':
     state = SimpleState(file=config['simple_state']['file'],
                         default={'last_id': 0})
 
-    max_last_id = 0
-    for name, mac in config['devices'].items():
-        last_id = main(mac, title=name)
-        if last_id > max_last_id:
-            max_last_id = last_id
-
+    max_last_id = main()
     if max_last_id:
         state['last_id'] = max_last_id
@@ -1,21 +1,23 @@
 #!/usr/bin/env python3
+import asyncio
+
 from home import http
 from home.config import config
-from home.mqtt import MQTTRelay, MQTTRelayDevice, MQTTRelayState
-from home.mqtt.payload import MQTTPayload
-from home.mqtt.payload.relay import InitialStatPayload, StatPayload
+from home.mqtt import MQTTAsyncRelay, MQTTRelayDevice, MQTTRelayState
+from home.util import stringify
 from typing import Optional
 
-mqtt_relay: Optional[MQTTRelay] = None
-relay_states: dict[str, MQTTRelayState] = {}
+mqtt_relay: Optional[MQTTAsyncRelay] = None
 
 
-def on_mqtt_message(device_id, message: MQTTPayload):
-    if isinstance(message, InitialStatPayload) or isinstance(message, StatPayload):
-        kwargs = dict(rssi=message.rssi, enabled=message.flags.state)
-        if device_id not in relay_states:
-            relay_states[device_id] = MQTTRelayState()
-        relay_states[device_id].update(**kwargs)
+def state_as_dict(state: Optional[MQTTRelayState]) -> Optional[dict]:
+    if state is None or not state.ever_updated:
+        return None
+    return {
+        'enabled': state.enabled,
+        'rssi': state.rssi,
+        'update_time': state.update_time
+    }
 
 
 class RelayMqttHttpProxy(http.HTTPServer):
@@ -24,6 +26,8 @@ class RelayMqttHttpProxy(http.HTTPServer):
         self.get('/relay/{id}/on', self.relay_on)
         self.get('/relay/{id}/off', self.relay_off)
         self.get('/relay/{id}/toggle', self.relay_toggle)
+        self.get('/relay/{id}/state', self.relay_state)
+        self.get('/relay/events', self.relay_events)
 
     async def _relay_on_off(self,
                             enable: Optional[bool],
@@ -32,13 +36,27 @@ class RelayMqttHttpProxy(http.HTTPServer):
         device_secret = req.query['secret']
 
         if enable is None:
-            if device_id in relay_states and relay_states[device_id].ever_updated:
-                cur_state = relay_states[device_id].enabled
+            state = mqtt_relay.get_state(device_id)
+            if state is not None and state.ever_updated:
+                cur_state = state.enabled
             else:
                 cur_state = False
             enable = not cur_state
 
-        mqtt_relay.set_power(device_id, enable, device_secret)
+        timeout = float(req.query['timeout']) if 'timeout' in req.query else 5
+
+        # ?confirm=1 makes the request wait until the device reports the new state
+        if 'confirm' in req.query and req.query['confirm'] == '1':
+            try:
+                state = await mqtt_relay.set_power_and_confirm(device_id, enable, device_secret, timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'device {device_id} did not confirm the new state in {timeout} s')
+            return self.ok(state_as_dict(state))
+
+        try:
+            await asyncio.wait_for(mqtt_relay.set_power(device_id, enable, device_secret), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'broker did not acknowledge the command in {timeout} s')
         return self.ok()
 
     async def relay_on(self, req: http.Request):
@@ -50,17 +68,46 @@ class RelayMqttHttpProxy(http.HTTPServer):
     async def relay_toggle(self, req: http.Request):
         return await self._relay_on_off(None, req)
 
+    async def relay_state(self, req: http.Request):
+        state = state_as_dict(mqtt_relay.get_state(req.match_info['id']))
+        if state is None:
+            # unknown device, or it hasn't reported its state yet
+            raise http.HTTPNotFound()
+        return self.ok(state)
+
+    async def relay_events(self, req: http.Request):
+        # server-sent events feed of relay state changes
+        response = http.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+        })
+        await response.prepare(req)
+
+        for device_id, state in mqtt_relay.get_states().items():
+            await response.write(self._sse_event(device_id, state))
+
+        async for device_id, state in mqtt_relay.watch():
+            await response.write(self._sse_event(device_id, state))
+
+        return response
+
+    @staticmethod
+    def _sse_event(device_id: str, state: MQTTRelayState) -> bytes:
+        data = stringify({'id': device_id, 'state': state_as_dict(state)})
+        return f'event: state\ndata: {data}\n\n'.encode('utf-8')
+
 
 if __name__ == '__main__':
     config.load('relay_mqtt_http_proxy')
 
-    mqtt_relay = MQTTRelay(devices=[MQTTRelayDevice(id=device_id) for device_id in config.get('relay.devices')])
+    loop = asyncio.get_event_loop()
+
+    mqtt_relay = MQTTAsyncRelay(devices=[MQTTRelayDevice(id=device_id) for device_id in config.get('relay.devices')])
     mqtt_relay.configure_tls()
-    mqtt_relay.set_message_callback(on_mqtt_message)
-    mqtt_relay.connect_and_loop(loop_forever=False)
+    loop.run_until_complete(mqtt_relay.connect())
 
     proxy = RelayMqttHttpProxy(config.get_addr('server.listen'))
     try:
-        proxy.run()
+        proxy.run(loop)
     except KeyboardInterrupt:
-        mqtt_relay.disconnect()
+        loop.run_until_complete(mqtt_relay.disconnect())
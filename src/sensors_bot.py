@@ -56,6 +56,7 @@ bot.lang.en(
 plt.rcParams['font.size'] = 7
 logger = logging.getLogger(__name__)
 plot_hours = [3, 6, 12, 24]
+plot_points = 500  # a plot doesn't need more points than it has pixels
 
 
 _sensor_names = []
@@ -112,7 +113,7 @@ def callback_handler(ctx: bot.Context) -> None:
     hours = int(match.group(2))
 
     api = WebAPIClient(timeout=20)
-    data = api.get_sensors_data(sensor, hours)
+    data = api.get_sensors_data(sensor, hours, resolution=hours*3600 // plot_points, ranges=True)
 
     title = ctx.lang(sensor.name.lower()) + ' (' + ctx.lang('n_hrs', hours) + ')'
     plot = draw_plot(data, title,
@@ -130,16 +131,21 @@ def draw_plot(data,
     tempval = []
     humval = []
     dates = []
-    for date, temp, humidity in data:
+    # (temp_min, temp_max, hum_min, hum_max)
+    ranges = []
+    for date, temp, humidity, *minmax in data:
         dates.append(date)
         tempval.append(temp)
         humval.append(humidity)
+        ranges.append(minmax)
 
     fig, axs = plt.subplots(2, 1)
     df = mdates.DateFormatter('%H:%M')
 
     axs[0].set_title(label_temp)
     axs[0].plot(dates, tempval)
+    if ranges:
+        axs[0].fill_between(dates, [r[0] for r in ranges], [r[1] for r in ranges], alpha=0.3)
     axs[0].xaxis.set_major_formatter(df)
     axs[0].yaxis.set_major_formatter(mticker.FormatStrFormatter('%2.2f °C'))
 
@@ -147,6 +153,8 @@ def draw_plot(data,
 
     axs[1].set_title(label_hum)
     axs[1].plot(dates, humval)
+    if ranges:
+        axs[1].fill_between(dates, [r[2] for r in ranges], [r[3] for r in ranges], alpha=0.3)
     axs[1].xaxis.set_major_formatter(df)
     axs[1].yaxis.set_major_formatter(mticker.FormatStrFormatter('%2.1f %%'))
 
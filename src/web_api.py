@@ -2,13 +2,18 @@
 import asyncio
 import json
 import os
+import time
 
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
 
 from aiohttp import web
 from home import http
 from home.config import config, is_development_mode
-from home.database import BotsDatabase, SensorsDatabase, InverterDatabase
+from home.database import BotsDatabase, SensorsDatabase, InverterDatabase, ClickhouseDatabase, get_mysql
 from home.database.inverter_time_formats import *
 from home.api.types import BotType, TemperatureSensorLocation, SoundSensorLocation
 from home.media import SoundRecordStorage
@@ -24,6 +29,84 @@ def strptime_auto(s: str) -> datetime:
     raise e
 
 
+# Max number of concurrent database calls per group of endpoints, so that heavy
+# inverter queries can't take all ClickHouse executor threads.
+ConcurrencyLimits = {
+    'sensors': 2,
+    'inverter': 2,
+    'bots': 16
+}
+
+# Max number of points in a status series response.
+StatusSeriesMaxPoints = 10000
+
+
+class ResultCache:
+    """
+    LRU cache of computed responses. Results for windows that ended more than
+    closed_delay ago can't change anymore and never expire, the others live
+    for live_ttl seconds. Concurrent requests for the same key share one
+    computation.
+    """
+
+    def __init__(self,
+                 max_size: int = 512,
+                 live_ttl: int = 60,
+                 closed_delay: timedelta = timedelta(hours=1)):
+        self.max_size = max_size
+        self.live_ttl = live_ttl
+        self.closed_delay = closed_delay
+
+        self.entries = OrderedDict()  # key => (expiration time or None, value)
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: tuple, dt_to: datetime, compute):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires is None or expires > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        if key in self.pending:
+            self.hits += 1
+            return await asyncio.shield(self.pending[key])
+
+        self.misses += 1
+        future = asyncio.ensure_future(compute())
+        self.pending[key] = future
+        # stored when computed, even if the request that started it is gone by then
+        future.add_done_callback(partial(self._store, key, dt_to))
+        return await asyncio.shield(future)
+
+    def _store(self, key: tuple, dt_to: datetime, future: asyncio.Future):
+        del self.pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        expires: Optional[float] = None
+        if dt_to > datetime.now() - self.closed_delay:
+            expires = time.time() + self.live_ttl
+
+        self.entries[key] = (expires, future.result())
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0
+        }
+
+
 class AuthError(Exception):
     def __init__(self, message: str):
         super().__init__()
@@ -46,8 +129,33 @@ class WebAPIServer(http.HTTPServer):
 
         self.get('/inverter/consumed_energy/', self.GET_consumed_energy)
         self.get('/inverter/grid_consumed_energy/', self.GET_grid_consumed_energy)
+        self.get('/inverter/status_series/', self.GET_status_series)
 
         self.get('/recordings/list/', self.GET_recordings_list)
+        self.get('/cache/stats/', self.GET_cache_stats)
+
+        # database objects are shared by all requests; blocking calls are run
+        # on executors sized like the connection pools
+        self.sensors_db = SensorsDatabase()
+        self.inverter_db = InverterDatabase()
+        self.bots_db = BotsDatabase()
+        self.mysql_executor = ThreadPoolExecutor(max_workers=get_mysql().size, thread_name_prefix='mysql')
+        self.semaphores = {}
+        self.cache = ResultCache()
+
+    def _get_semaphore(self, group: str) -> asyncio.Semaphore:
+        if group not in self.semaphores:
+            self.semaphores[group] = asyncio.Semaphore(ConcurrencyLimits[group])
+        return self.semaphores[group]
+
+    async def clickhouse_call(self, group: str, f, *args, **kwargs):
+        async with self._get_semaphore(group):
+            return await ClickhouseDatabase.run_async(f, *args, **kwargs)
+
+    async def mysql_call(self, f, *args, **kwargs):
+        async with self._get_semaphore('bots'):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.mysql_executor, partial(f, *args, **kwargs))
 
     @staticmethod
     @web.middleware
@@ -89,8 +197,19 @@ class WebAPIServer(http.HTTPServer):
         dt_to = datetime.now()
         dt_from = dt_to - timedelta(hours=hours)
 
-        db = SensorsDatabase()
-        data = db.get_temperature_recordings(sensor, (dt_from, dt_to))
+        # optional, in seconds: no point returning more than a chart can show
+        resolution = int(req.query['resolution']) if 'resolution' in req.query else None
+        if resolution is not None and resolution < 1:
+            raise ValueError('invalid resolution value')
+
+        # rows are (time, temp, humidity), and with ranges=1 also (temp_min, temp_max, humidity_min, humidity_max)
+        ranges = 'ranges' in req.query and req.query['ranges'] == '1'
+
+        data = await self.cache.get(('sensors', sensor, hours, resolution, ranges), dt_to,
+                                    lambda: self.clickhouse_call('sensors',
+                                                                 self.sensors_db.get_temperature_recordings,
+                                                                 sensor, (dt_from, dt_to),
+                                                                 resolution=resolution, ranges=ranges))
         return self.ok(data)
 
     async def GET_sound_sensors_hits(self, req: http.Request):
@@ -109,7 +228,7 @@ class WebAPIServer(http.HTTPServer):
         else:
             kwargs['after'] = datetime.fromtimestamp(after)
 
-        data = BotsDatabase().get_sound_hits(location, **kwargs)
+        data = await self.mysql_call(self.bots_db.get_sound_hits, location, **kwargs)
         return self.ok(data)
 
     async def POST_sound_sensors_hits(self, req: http.Request):
@@ -122,7 +241,7 @@ class WebAPIServer(http.HTTPServer):
                 raise ValueError(f'invalid count: {count}')
             hits.append((SoundSensorLocation[hit.upper()], count))
 
-        BotsDatabase().add_sound_hits(hits, datetime.now())
+        await self.mysql_call(self.bots_db.add_sound_hits, hits, datetime.now())
         return self.ok()
 
     async def POST_bot_request_log(self, req: http.Request):
@@ -145,7 +264,7 @@ class WebAPIServer(http.HTTPServer):
             raise ValueError('message can\'t be empty')
 
         # add record to the database
-        BotsDatabase().add_request(bot, user_id, message)
+        await self.mysql_call(self.bots_db.add_request, bot, user_id, message)
 
         return self.ok()
 
@@ -173,7 +292,7 @@ class WebAPIServer(http.HTTPServer):
                 line[1]
             ))
 
-        BotsDatabase().add_openwrt_logs(lines)
+        await self.mysql_call(self.bots_db.add_openwrt_logs, lines)
         return self.ok()
 
     async def GET_recordings_list(self, req: http.Request):
@@ -197,6 +316,9 @@ class WebAPIServer(http.HTTPServer):
 
         return self.ok(files)
 
+    async def GET_cache_stats(self, req: http.Request):
+        return self.ok(self.cache.stats())
+
     @staticmethod
     def _get_inverter_from_to(req: http.Request):
         s_from = req.query['from']
@@ -211,15 +333,49 @@ class WebAPIServer(http.HTTPServer):
 
         return dt_from, dt_to
 
+    @staticmethod
+    def _inverter_cache_key(name: str, req: http.Request, dt_from: datetime, dt_to: datetime, *args) -> tuple:
+        # by parsed dates, so that the same range written differently is the same key
+        return name, dt_from, 'now' if req.query['to'] == 'now' else dt_to, *args
+
     async def GET_consumed_energy(self, req: http.Request):
         dt_from, dt_to = self._get_inverter_from_to(req)
-        wh = InverterDatabase().get_consumed_energy(dt_from, dt_to)
+        wh = await self.cache.get(self._inverter_cache_key('consumed_energy', req, dt_from, dt_to), dt_to,
+                                  lambda: self.clickhouse_call('inverter',
+                                                               self.inverter_db.get_consumed_energy,
+                                                               dt_from, dt_to))
         return self.ok(wh)
 
     async def GET_grid_consumed_energy(self, req: http.Request):
         dt_from, dt_to = self._get_inverter_from_to(req)
-        wh = InverterDatabase().get_grid_consumed_energy(dt_from, dt_to)
-        return self.ok(wh)
+        breakdown = 'breakdown' in req.query and req.query['breakdown'] == '1'
+
+        async def compute():
+            db = self.inverter_db
+            if not breakdown:
+                return await self.clickhouse_call('inverter', db.get_grid_consumed_energy, dt_from, dt_to)
+
+            result = await self.clickhouse_call('inverter', db.get_grid_consumed_energy_breakdown, dt_from, dt_to)
+            result['days'] = [[day.strftime(FormatDate), wh] for day, wh in result['days']]
+            return result
+
+        key = self._inverter_cache_key('grid_consumed_energy', req, dt_from, dt_to, breakdown)
+        return self.ok(await self.cache.get(key, dt_to, compute))
+
+    async def GET_status_series(self, req: http.Request):
+        dt_from, dt_to = self._get_inverter_from_to(req)
+        fields = req.query['fields'].split(',')
+        step = int(req.query['step']) if 'step' in req.query else 60
+        if step < 1:
+            raise ValueError('invalid step value')
+        if (dt_to - dt_from).total_seconds() / step > StatusSeriesMaxPoints:
+            raise ValueError(f'too many points, the limit is {StatusSeriesMaxPoints}')
+
+        key = self._inverter_cache_key('status_series', req, dt_from, dt_to, tuple(fields), step)
+        return self.ok(await self.cache.get(key, dt_to,
+                                            lambda: self.clickhouse_call('inverter',
+                                                                         self.inverter_db.get_status_series,
+                                                                         dt_from, dt_to, fields, step)))
 
 
 # start of the program
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import sys
+import random
+import os.path
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+import src.home.database.inverter as inverter_db
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from src.home.config import config
+from src.home.database.clickhouse import get_clickhouse
+from src.home.database.inverter import InverterDatabase, RollupMinRange
+
+
+# Fills a scratch database with irregular statuses (dense runs, sparse change-driven
+# samples and gaps longer than fill_max_gap) and checks that get_consumed_energy(),
+# which takes whole hours from status_energy_hourly for long ranges, agrees with
+# integration of raw data and with a reference integration done here.
+# Needs a ClickHouse server, the database is dropped at the end.
+
+def generate(start: int, stop: int, seed: int) -> list[tuple[int, int]]:
+    rnd = random.Random(seed)
+    samples = []
+    t = start
+    w = 500
+    while t < stop:
+        samples.append((t, w))
+        w = max(0, min(3000, w + rnd.randint(-300, 300)))
+        r = rnd.random()
+        if r < 0.6:
+            t += rnd.randint(1, 60)
+        elif r < 0.97:
+            t += rnd.randint(60, 600)
+        else:
+            t += rnd.randint(900, 7200)
+    return samples
+
+
+def reference(samples: list[tuple[int, int]], t_from: int, t_to: int, end: int, gap: int) -> float:
+    ws = 0
+    for i, (t, w) in enumerate(samples):
+        if t > t_to:
+            break
+        next_t = samples[i+1][0] if i + 1 < len(samples) and samples[i+1][0] <= t_to else end
+        s = max(t, t_from)
+        e = min(next_t, t + gap, end)
+        if e > s:
+            ws += w * (e - s)
+    return ws / 3600
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--database', type=str, default='solarmon_rollup_test')
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--ranges', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = config.load(False, parser=parser)
+
+    server = get_clickhouse('default')
+    server.execute(f'DROP DATABASE IF EXISTS {args.database}')
+    server.execute(f'CREATE DATABASE {args.database}')
+    try:
+        db = InverterDatabase(args.database)
+        db.query("""CREATE TABLE status (
+                ClientTime DateTime,
+                ReceivedTime DateTime,
+                HomeID UInt16,
+                ACOutputActivePower UInt16
+            ) ENGINE = MergeTree()
+            ORDER BY ClientTime""")
+        db.query("""CREATE TABLE status_energy_hourly (
+                Hour DateTime,
+                Wh Float64
+            ) ENGINE = ReplacingMergeTree()
+            ORDER BY Hour""")
+
+        # the data ends in the past, so that the whole range is closed
+        stop = int((datetime.now() - timedelta(hours=2)).timestamp())
+        start = stop - args.days * 86400
+        samples = generate(start, stop, args.seed)
+        db.db.execute('INSERT INTO status (ClientTime, ReceivedTime, HomeID, ACOutputActivePower) VALUES',
+                      [[t, t, 1, w] for t, w in samples])
+        print(f'{len(samples)} samples in {args.days} days')
+
+        inverter_db._energy_rollup_hi = None
+        gap = int(db.fill_max_gap.total_seconds())
+        rnd = random.Random(args.seed)
+        failed = 0
+        for _ in range(args.ranges):
+            t_from = rnd.randint(start - 3600, stop - int(RollupMinRange.total_seconds()))
+            t_to = rnd.randint(t_from + int(RollupMinRange.total_seconds()), stop + 3600)
+            dt_from = datetime.fromtimestamp(t_from)
+            dt_to = datetime.fromtimestamp(t_to)
+
+            rollup = db.get_consumed_energy(dt_from, dt_to)
+            raw = db._integrate_consumed_energy(dt_from, dt_to)
+            ref = reference(samples, t_from, t_to, t_to, gap)
+
+            ok = abs(rollup - ref) < 0.01 and abs(raw - ref) < 0.01
+            if not ok:
+                failed += 1
+            print(f'{"PASS" if ok else "FAIL"} {dt_from} - {dt_to}: rollup {rollup:.3f}, raw {raw:.3f}, reference {ref:.3f} Wh')
+
+    finally:
+        server.execute(f'DROP DATABASE IF EXISTS {args.database}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,7 @@ from src.home.util import stringify
 from src.home.config import config
 from src.home.inverter import (
     wrapper_instance as inverter,
+    poller_instance as poller,
 
     InverterMonitor,
     ChargingEvent,
@@ -350,6 +351,8 @@ def main():
     inverter.init(host=config['inverter']['host'],
                   port=config['inverter']['port'])
 
+    poller.start()
+
     # start monitor
     mon = InverterMonitor()
     mon.set_charging_event_handler(monitor_charging)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import sys
+import logging
+import os.path
+import tempfile
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+from argparse import ArgumentParser
+from src.home.config import config
+from src.home.inverter import InverterMonitor, MonitorJournal
+from src.home.inverter.types import ACMode, ChargingState
+from src.home.inverter.emulator import InverterEmulator
+from src.home.inverter.simulation import Scenario, VirtualClock
+from test_inverter_monitor_sim import MonitorDefaults, ScenariosDir
+
+# Checks MonitorJournal recovery (torn last line, compaction) and that a monitor
+# restarted in the middle of a generator charging cycle continues it from the
+# journal, unless the saved state is too old.
+
+failed = 0
+
+
+def check(name: str, ok: bool, details: str = ''):
+    global failed
+    if not ok:
+        failed += 1
+    print(f'{"PASS" if ok else "FAIL"} {name}' + (f': {details}' if details and not ok else ''))
+
+
+def read_lines(path: str) -> list[str]:
+    with open(path, encoding='utf-8') as f:
+        return f.read().split('\n')
+
+
+def test_torn_line(dir: str):
+    path = os.path.join(dir, 'torn.journal')
+    journal = MonitorJournal(path)
+    journal.append({'n': 1})
+    journal.append({'n': 2})
+    journal.close()
+
+    # crashed in the middle of writing the third record
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"n":3,"charging')
+
+    journal = MonitorJournal(path)
+    check('torn line: last complete record is loaded', journal.load() == {'n': 2}, str(journal.load()))
+
+    journal.append({'n': 4})
+    journal.close()
+    check('torn line: next record is not glued to it', MonitorJournal(path).load() == {'n': 4},
+          str(read_lines(path)))
+
+
+def test_compaction(dir: str):
+    path = os.path.join(dir, 'compaction.journal')
+    journal = MonitorJournal(path, max_records=5)
+    for n in range(12):
+        journal.append({'n': n})
+    journal.close()
+
+    lines = [line for line in read_lines(path) if line]
+    check('compaction: journal is bounded', len(lines) <= 5, f'{len(lines)} lines')
+    check('compaction: last record is kept', MonitorJournal(path).load() == {'n': 11}, str(lines))
+    check('compaction: no temporary file left', not os.path.exists(path + '.tmp'))
+
+
+def create_monitor(clock: VirtualClock, emulator: InverterEmulator, path: str, events: list) -> InverterMonitor:
+    mon = InverterMonitor(clock=clock.time, client=emulator)
+    mon.set_charging_event_handler(lambda event, **kwargs: events.append(event.name))
+    mon.set_battery_event_handler(lambda state, v, load_watts: None)
+    mon.set_util_event_handler(lambda event: None)
+    mon.set_error_handler(lambda error: events.append(f'ERROR: {error}'))
+    mon.set_osp_need_change_callback(lambda osp, **kwargs: None)
+    mon.set_ac_mode(ACMode.GENERATOR)
+    mon.set_journal(MonitorJournal(path))
+    return mon
+
+
+def test_restore(dir: str):
+    path = os.path.join(dir, 'monitor.journal')
+    scenario = Scenario.load(os.path.join(ScenariosDir, 'generator_full_cycle.toml'))
+    config.data['monitor'] = {**MonitorDefaults, **scenario.monitor}
+
+    clock = VirtualClock()
+    emulator = InverterEmulator(addr=None, model=scenario.create_model(), scenario=scenario, clock=clock.time)
+    events = []
+
+    # in the middle of raising the current
+    mon = create_monitor(clock, emulator, path, events)
+    current = mon._setup(emulator.exec('get-allowed-ac-charge-currents')['data'],
+                         emulator.exec('get-rated')['data'])
+    check('restore: nothing to resume from an empty journal', current is None, str(current))
+    started = clock.time()
+    while clock.time() - started < 400:
+        clock.advance(scenario.interval)
+        mon.process_status(emulator.exec('get-status')['data'])
+    mon.journal.close()
+    saved = mon.dump_state()
+
+    # the inverter may come up with another current after a restart
+    emulator.exec('set-max-ac-charge-current', (0, mon.currents[0]))
+
+    mon = create_monitor(clock, emulator, path, events)
+    current = mon._setup(emulator.exec('get-allowed-ac-charge-currents')['data'],
+                         emulator.exec('get-rated')['data'])
+    check('restore: charging is resumed', mon.charging_state == ChargingState.AC_OK, mon.charging_state.name)
+    check('restore: the same state', mon.dump_state() == saved, f'{mon.dump_state()} != {saved}')
+    check('restore: current to put back', current is not None and current == saved_current(saved),
+          f'{current}')
+    mon.journal.close()
+
+    # restarted after a long outage, the saved state is not resumed
+    clock.advance(2 * MonitorJournal(path).max_age)
+
+    mon = create_monitor(clock, emulator, path, events)
+    current = mon._setup(emulator.exec('get-allowed-ac-charge-currents')['data'],
+                         emulator.exec('get-rated')['data'])
+    check('stale: nothing to put back', current is None, str(current))
+    check('stale: starting over', mon.charging_state == ChargingState.NOT_CHARGING, mon.charging_state.name)
+    mon.journal.close()
+
+
+def saved_current(state: dict) -> int:
+    return state['currents'][state['active_current_idx']]
+
+
+def main():
+    parser = ArgumentParser()
+    args = config.load(False, parser=parser)
+    if not args.verbose:
+        logging.getLogger('src.home.inverter').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as dir:
+        test_torn_line(dir)
+        test_compaction(dir)
+        test_restore(dir)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import sys
+import time
+import logging
+import glob
+import os.path
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+from argparse import ArgumentParser
+from src.home.config import config
+from src.home.inverter import InverterMonitor
+from src.home.inverter.types import ACMode, ChargingEvent
+from src.home.inverter.emulator import InverterEmulator
+from src.home.inverter.simulation import Scenario, VirtualClock
+from src.home.inverter.recording import RecordingModel
+
+# [monitor] config from doc/inverter_bot.md, scenarios may override it
+MonitorDefaults = {
+    'vlow': 47,
+    'vcrit': 45,
+    'gen_currents': [2, 10, 20, 30],
+    'gen_raise_intervals': [180, 120, 120],
+    'gen_cur30_v_limit': 56.9,
+    'gen_cur20_v_limit': 56.7,
+    'gen_cur10_v_limit': 54,
+    'gen_floating_v': 54,
+    'gen_floating_time_max': 7200,
+}
+
+ScenariosDir = os.path.join(os.path.dirname(__file__), 'inverter_scenarios')
+
+
+class SimResult:
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self.events = []   # (virtual seconds since start, event)
+        self.ticks = 0
+        self.wall_time = 0.
+
+    def names(self) -> list[str]:
+        return [e for _, e in self.events]
+
+    def passed(self) -> bool:
+        return self.scenario.expected_events is None or self.names() == self.scenario.expected_events
+
+
+def simulate(scenario: Scenario, model=None) -> SimResult:
+    # the monitor reads its settings from the config, and this is the only
+    # way to give each scenario its own
+    config.data['monitor'] = {**MonitorDefaults, **scenario.monitor}
+
+    result = SimResult(scenario)
+    clock = VirtualClock()
+    started = clock.time()
+    emulator = InverterEmulator(addr=None,
+                                model=model if model is not None else scenario.create_model(),
+                                scenario=scenario,
+                                clock=clock.time)
+
+    def record(event: str):
+        result.events.append((int(clock.time() - started), event))
+
+    def on_charging(event: ChargingEvent, **kwargs):
+        if event == ChargingEvent.AC_CURRENT_CHANGED:
+            record(f'{event.name}:{kwargs["current"]}')
+        else:
+            record(event.name)
+
+    mon = InverterMonitor(clock=clock.time, client=emulator)
+    mon.set_charging_event_handler(on_charging)
+    mon.set_battery_event_handler(lambda state, v, load_watts: record(f'BATTERY_{state.name}'))
+    mon.set_util_event_handler(lambda event: record(f'UTIL_AC_{event.name}'))
+    mon.set_error_handler(lambda error: record(f'ERROR: {error}'))
+    mon.set_osp_need_change_callback(lambda osp, **kwargs: record(f'OSP:{osp.value}'))
+    mon.set_ac_mode(ACMode(scenario.ac_mode))
+    mon._setup(emulator.exec('get-allowed-ac-charge-currents')['data'],
+               emulator.exec('get-rated')['data'])
+
+    wall_started = time.perf_counter()
+    while clock.time() - started < scenario.duration:
+        clock.advance(scenario.interval)
+        mon.process_status(emulator.exec('get-status')['data'])
+        result.ticks += 1
+    result.wall_time = time.perf_counter() - wall_started
+
+    return result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('scenarios', nargs='*',
+                        help='scenario files, all from test/inverter_scenarios by default')
+    parser.add_argument('--timeline', action='store_true',
+                        help='print the events of every scenario, not only of failed ones')
+    parser.add_argument('--recording', type=str, action='append', default=[],
+                        help='run the monitor on a status recording instead (see src/inverter_recorder.py)')
+    parser.add_argument('--ac-mode', type=str, default='generator', choices=[m.value for m in ACMode],
+                        help='AC mode for recordings')
+    args = config.load(False, parser=parser)
+    if not args.verbose:
+        # the monitor logs every step of the program, which is too much here
+        logging.getLogger('src.home.inverter').setLevel(logging.WARNING)
+
+    runs = []
+    for path in args.recording:
+        model = RecordingModel(path)
+        runs.append((path, Scenario({'duration': model.duration, 'ac_mode': args.ac_mode}, path), model))
+    if not runs:
+        for path in args.scenarios or sorted(glob.glob(os.path.join(ScenariosDir, '*.toml'))):
+            runs.append((path, Scenario.load(path), None))
+
+    failed = 0
+    for path, scenario, model in runs:
+        result = simulate(scenario, model)
+        ok = result.passed()
+        if not ok:
+            failed += 1
+
+        hours = result.ticks * result.scenario.interval / 3600
+        print(f'{"PASS" if ok else "FAIL"} {os.path.basename(path)}: '
+              f'{hours:.1f} h in {result.wall_time:.2f} s '
+              f'({result.ticks / result.wall_time:.0f} ticks/s)')
+
+        if args.timeline or not ok:
+            for t, event in result.events:
+                print(f'    {t // 3600:02d}:{t % 3600 // 60:02d}:{t % 60:02d} {event}')
+            if not ok:
+                print(f'    expected: {result.scenario.expected_events}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
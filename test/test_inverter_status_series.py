@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import sys
+import random
+import os.path
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+from argparse import ArgumentParser
+from datetime import datetime
+from src.home.config import config
+from src.home.database.clickhouse import get_clickhouse
+from src.home.database.inverter import InverterDatabase
+
+# Fills a scratch database with change-driven statuses (runs of samples, pauses
+# up to the heartbeat and gaps longer than fill_max_gap) and checks that
+# get_status_series() forward-fills them like a reference done here.
+# Needs a ClickHouse server, the database is dropped at the end.
+
+Fields = ['ACOutputActivePower', 'BatteryVoltage']
+
+
+def generate(start: int, stop: int, seed: int) -> list[tuple[int, int, int]]:
+    rnd = random.Random(seed)
+    samples = []
+    t = start
+    w, v = 500, 520
+    while t < stop:
+        samples.append((t, w, v))
+        w = max(0, min(3000, w + rnd.randint(-300, 300)))
+        v = max(400, min(580, v + rnd.randint(-5, 5)))
+        r = rnd.random()
+        if r < 0.7:
+            t += rnd.randint(1, 60)
+        elif r < 0.95:
+            t += rnd.randint(60, 300)
+        else:
+            t += rnd.randint(900, 3600)
+    return samples
+
+
+def reference(samples: list[tuple[int, int, int]], t_from: int, t_to: int, step: int, gap: int) -> list[tuple]:
+    series = []
+    i = 0
+    last = None
+    for t in range(t_from, t_to + 1, step):
+        while i < len(samples) and samples[i][0] <= t:
+            last = samples[i]
+            i += 1
+        if last is not None and t - last[0] <= gap:
+            series.append((t, *last[1:]))
+    return series
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--database', type=str, default='solarmon_series_test')
+    parser.add_argument('--hours', type=int, default=12)
+    parser.add_argument('--ranges', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = config.load(False, parser=parser)
+
+    server = get_clickhouse('default')
+    server.execute(f'DROP DATABASE IF EXISTS {args.database}')
+    server.execute(f'CREATE DATABASE {args.database}')
+    failed = 0
+    try:
+        db = InverterDatabase(args.database)
+        db.query("""CREATE TABLE status (
+                ClientTime DateTime,
+                ReceivedTime DateTime,
+                HomeID UInt16,
+                ACOutputActivePower UInt16,
+                BatteryVoltage UInt16
+            ) ENGINE = MergeTree()
+            ORDER BY ClientTime""")
+
+        stop = int(datetime.now().timestamp())
+        start = stop - args.hours * 3600
+        samples = generate(start, stop, args.seed)
+        db.db.execute('INSERT INTO status (ClientTime, ReceivedTime, HomeID, ACOutputActivePower, BatteryVoltage) VALUES',
+                      [[t, t, 1, w, v] for t, w, v in samples])
+        print(f'{len(samples)} samples in {args.hours} hours')
+
+        gap = int(db.fill_max_gap.total_seconds())
+        rnd = random.Random(args.seed)
+        for _ in range(args.ranges):
+            t_from = rnd.randint(start - 600, stop - 600)
+            t_to = rnd.randint(t_from + 60, min(stop + 600, t_from + 4 * 3600))
+            step = rnd.choice([1, 7, 60, 300])
+
+            series = db.get_status_series(datetime.fromtimestamp(t_from), datetime.fromtimestamp(t_to), Fields, step)
+            series = [(int(t.timestamp()), *values) for t, *values in series]
+            ref = reference(samples, t_from, t_to, step, gap)
+
+            ok = series == ref
+            if not ok:
+                failed += 1
+            print(f'{"PASS" if ok else "FAIL"} {datetime.fromtimestamp(t_from)} - {datetime.fromtimestamp(t_to)}'
+                  f' by {step} s: {len(series)} points, reference {len(ref)}')
+
+        try:
+            db.get_status_series(datetime.fromtimestamp(start), datetime.fromtimestamp(stop), ['1; DROP TABLE status'], 60)
+            ok = False
+        except ValueError:
+            ok = True
+        if not ok:
+            failed += 1
+        print(f'{"PASS" if ok else "FAIL"} unknown columns are rejected')
+
+    finally:
+        server.execute(f'DROP DATABASE IF EXISTS {args.database}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+import os.path
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+import src.home.telegram.aio as telegram
+
+from src.home.config import config
+
+
+async def main():
+    # one sendMediaGroup request
+    await telegram.send_photos(['/tmp/3.jpg', '/tmp/4.jpg'], caption='test album')
+    # two requests: an album of 10 photos, with the caption, and one of 2
+    await telegram.send_photos(['/tmp/3.jpg', '/tmp/4.jpg'] * 6, caption='test albums')
+    await telegram.close()
+
+
+if __name__ == '__main__':
+    config.load('test_telegram_aio_send_photos')
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
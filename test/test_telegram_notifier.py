@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import sys
+import time
+import random
+import threading
+import os.path
+sys.path.extend([
+    os.path.realpath(
+        os.path.join(os.path.dirname(os.path.join(__file__)), '..')
+    )
+])
+
+from telegram.error import RetryAfter, NetworkError, BadRequest
+from src.home.telegram._botnotify import Notifier
+
+# Runs Notifier against a fake send() and checks that messages to each user
+# arrive in order, that the overall rate is limited, that RetryAfter pauses
+# everyone, that errors which would repeat are not retried, and the stats.
+
+failed = 0
+
+
+def check(name: str, ok: bool, details: str = ''):
+    global failed
+    if not ok:
+        failed += 1
+    print(f'{"PASS" if ok else "FAIL"} {name}' + (f': {details}' if details and not ok else ''))
+
+
+class FakeSend:
+    def __init__(self, errors: dict = None, delay: float = 0.005):
+        self.errors = errors or {}   # (user_id, text) => list of exceptions to raise, one per call
+        self.delay = delay
+        self.sent = []               # (time, user_id, text)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id: int, text: str):
+        with self._lock:
+            self.calls.append((time.monotonic(), user_id, text))
+            errors = self.errors.get((user_id, text))
+            error = errors.pop(0) if errors else None
+        time.sleep(random.uniform(0, self.delay))
+        if error is not None:
+            raise error
+        with self._lock:
+            self.sent.append((time.monotonic(), user_id, text))
+
+
+def wait(notifier: Notifier, total: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = notifier.stats.as_dict()
+        if stats['sent'] + stats['failed'] + stats['dropped'] >= total:
+            return
+        time.sleep(0.01)
+    raise TimeoutError('notifier is stuck')
+
+
+def test_order_and_rate():
+    users, per_user, rate = 10, 20, 100
+    send = FakeSend()
+    notifier = Notifier(send, workers=4, rate=rate)
+
+    started = time.monotonic()
+    for i in range(per_user):
+        for user_id in range(users):
+            notifier.submit(user_id, str(i))
+    wait(notifier, users * per_user)
+    elapsed = time.monotonic() - started
+
+    check('all delivered', len(send.sent) == users * per_user, f'{len(send.sent)} sent')
+    ordered = all([int(text) for _, u, text in send.sent if u == user_id] == list(range(per_user))
+                  for user_id in range(users))
+    check('in order for each user', ordered)
+    # the bucket starts full, with one token per worker
+    min_elapsed = (users * per_user - 4) / rate
+    check('rate limited', elapsed >= min_elapsed * 0.95, f'{elapsed:.2f} s < {min_elapsed:.2f} s')
+
+
+def test_retry_after():
+    send = FakeSend(errors={(1, 'flood'): [RetryAfter(1)]})
+    notifier = Notifier(send, workers=4, rate=100)
+
+    notifier.submit(1, 'flood')
+    time.sleep(0.2)
+    flooded = time.monotonic()
+    for user_id in range(2, 6):
+        notifier.submit(user_id, 'after')
+    wait(notifier, 5)
+
+    first_after = min(t for t, _, _ in send.sent)
+    check('RetryAfter: message is retried', any(u == 1 for _, u, _ in send.sent))
+    check('RetryAfter: other users are paused too', first_after - flooded >= 0.7,
+          f'sent {first_after - flooded:.2f} s after')
+
+
+def test_no_retry():
+    send = FakeSend(errors={(1, 'bad'): [BadRequest('chat not found')] * 3,
+                            (2, 'net'): [NetworkError('connection reset')] * 3})
+    notifier = Notifier(send, workers=2, rate=100, attempts=2)
+
+    started = time.monotonic()
+    notifier.submit(1, 'bad')
+    notifier.submit(2, 'net')
+    wait(notifier, 2)
+    elapsed = time.monotonic() - started
+
+    calls = {u: sum(1 for _, cu, _ in send.calls if cu == u) for u in (1, 2)}
+    check('BadRequest is not retried', calls[1] == 1, f'{calls[1]} calls')
+    check('NetworkError is retried', calls[2] == 2, f'{calls[2]} calls')
+    # one backoff of 1 s between the two attempts, none after the last one
+    check('no sleep after the last attempt', elapsed < 1.8, f'{elapsed:.2f} s')
+    stats = notifier.dump_stats()
+    check('not retried errors are counted as failed', stats['failed'] == 1, str(stats))
+    check('exhausted retries are counted as dropped', stats['dropped'] == 1, str(stats))
+
+
+def test_stats():
+    send = FakeSend(delay=0.05)
+    notifier = Notifier(send, workers=1, rate=100)
+
+    submitted = time.monotonic()
+    for i in range(5):
+        notifier.submit(1, str(i))
+    pending = notifier.dump_stats()['pending']
+    wait(notifier, 5)
+    stats = notifier.dump_stats()
+
+    check('stats: messages waiting are pending', pending >= 3, f'{pending} pending')
+    check('stats: nothing pending after delivery', stats['pending'] == 0, str(stats))
+    check('stats: delivered are counted', stats['sent'] == 5 and stats['failed'] == stats['dropped'] == 0, str(stats))
+    # the last one has waited for the others to be sent
+    latency = send.sent[-1][0] - submitted
+    check('stats: latency includes time in the queue', abs(stats['latency_last'] - latency) < 0.02
+          and stats['latency_max'] >= stats['latency_avg'] > 0, f'{stats}, expected latency_last {latency:.3f}')
+
+    text = notifier.format_stats()
+    check('stats: formatted', text.split('\n')[0] == 'sent: 5' and 'pending: 0' in text, text)
+
+
+if __name__ == '__main__':
+    test_order_and_rate()
+    test_retry_after()
+    test_no_retry()
+    test_stats()
+    sys.exit(1 if failed else 0)
@@ -7,10 +7,12 @@ sys.path.extend([
     )
 ])
 
-from time import sleep
+import asyncio
+
+from threading import Event
 from argparse import ArgumentParser
 from src.home.config import config
-from src.home.mqtt import MQTTRelay, MQTTRelayDevice
+from src.home.mqtt import MQTTRelay, MQTTAsyncRelay, MQTTRelayDevice
 
 
 def guess_filename(product: str, build_target: str):
@@ -25,25 +27,67 @@ def guess_filename(product: str, build_target: str):
 
 
 def relayctl_publish_ota(filename: str,
-                         device_id: str,
-                         home_secret: str,
-                         qos: int):
-    global stop
+                         device_ids: list[str],
+                         home_secrets: dict,
+                         qos: int,
+                         chunk_size: int):
+    if chunk_size == 0:
+        # legacy protocol: the whole image in a single message
+        for device_id in device_ids:
+            relayctl_publish_ota_single(filename, device_id, home_secrets[device_id], qos)
+        return
+
+    asyncio.run(relayctl_publish_ota_chunked(filename, device_ids, home_secrets, chunk_size))
 
-    def published():
-        global stop
-        stop = True
+
+def relayctl_publish_ota_single(filename: str,
+                                device_id: str,
+                                home_secret: str,
+                                qos: int):
+    published = Event()
 
     mqtt_relay = MQTTRelay(devices=MQTTRelayDevice(id=device_id, secret=home_secret))
     mqtt_relay.configure_tls()
     mqtt_relay.connect_and_loop(loop_forever=False)
-    mqtt_relay.push_ota(device_id, filename, published, qos)
-    while not stop:
-        sleep(0.1)
+    mqtt_relay.push_ota(device_id, filename, published.set, qos)
+    published.wait()
     mqtt_relay.disconnect()
 
 
-stop = False
+async def relayctl_publish_ota_chunked(filename: str,
+                                       device_ids: list[str],
+                                       home_secrets: dict,
+                                       chunk_size: int):
+    def progress(device_id, offset, size):
+        print(f'{device_id}: {offset}/{size} bytes ({offset*100//size}%)')
+
+    mqtt_relay = MQTTAsyncRelay(devices=[MQTTRelayDevice(id=device_id, secret=home_secrets[device_id])
+                                         for device_id in device_ids])
+    mqtt_relay.configure_tls()
+    await mqtt_relay.connect()
+
+    results = await asyncio.gather(*[mqtt_relay.push_ota(device_id, filename,
+                                                         chunk_size=chunk_size,
+                                                         progress_callback=progress)
+                                     for device_id in device_ids],
+                                   return_exceptions=True)
+    await mqtt_relay.disconnect()
+
+    failed = False
+    for device_id, result in zip(device_ids, results):
+        if isinstance(result, Exception):
+            print(f'{device_id}: error: {str(result)}', file=sys.stderr)
+            failed = True
+        elif result.result != 0:
+            print(f'{device_id}: update failed, error_code={result.error_code}', file=sys.stderr)
+            failed = True
+        else:
+            print(f'{device_id}: ok')
+
+    if failed:
+        raise RuntimeError('some of the updates failed')
+
+
 products = {
     'relayctl': {
         'build_target': 'esp12e',
@@ -61,9 +105,12 @@ products_dir = os.path.join(
 def main():
     parser = ArgumentParser()
     parser.add_argument('--filename', type=str)
-    parser.add_argument('--device-id', type=str, required=True)
+    parser.add_argument('--device-id', type=str, nargs='+', required=True)
     parser.add_argument('--product', type=str, required=True)
     parser.add_argument('--qos', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=1024,
+                        help='size of chunks in bytes, 0 means sending the image in a single message (old firmwares); '
+                             'devices that don\'t answer the chunked protocol get a single message anyway')
 
     config.load('mcuota_push', parser=parser)
     arg = parser.parse_args()
@@ -71,8 +118,9 @@ def main():
     if arg.product not in products:
         raise ValueError(f'invalid product: \'{arg.product}\' not found')
 
-    if arg.device_id not in config['mqtt']['home_secrets']:
-        raise ValueError(f'home_secret for home {arg.device_id} not found in config!')
+    for device_id in arg.device_id:
+        if device_id not in config['mqtt']['home_secrets']:
+            raise ValueError(f'home_secret for home {device_id} not found in config!')
 
     filename = arg.filename if arg.filename else guess_filename(arg.product, products[arg.product]['build_target'])
     if not os.path.exists(filename):
@@ -80,13 +128,15 @@ def main():
 
     print('Please confirm following OTA params.')
     print('')
-    print(f'    Device ID: {arg.device_id}')
+    print(f'   Device IDs: {", ".join(arg.device_id)}')
     print(f'      Product: {arg.product}')
     print(f'Firmware file: {filename}')
     print('')
     input('Press any key to continue or Ctrl+C to abort.')
 
-    products[arg.product]['callback'](filename, arg.device_id, config['mqtt']['home_secrets'][arg.device_id], qos=arg.qos)
+    products[arg.product]['callback'](filename, arg.device_id, config['mqtt']['home_secrets'],
+                                      qos=arg.qos,
+                                      chunk_size=arg.chunk_size)
 
 
 if __name__ == '__main__':